@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+from pyrogram import Client
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class AssistantPool:
+    """Places voice chats on the least-loaded healthy assistant account"""
+    
+    def __init__(self, assistants: List[Client], player):
+        self.assistants = assistants
+        self.player = player
+        self.assignments: Dict[int, str] = {}
+        self.limited_until: Dict[str, float] = {}
+        self.disconnected: set = set()
+        self.migrations = 0
+        self.health_task: Optional[asyncio.Task] = None
+    
+    def get(self, name: str) -> Optional[Client]:
+        """Get an assistant by session name"""
+        for client in self.assistants:
+            if client.name == name:
+                return client
+        return None
+    
+    def is_available(self, client: Client) -> bool:
+        """Check an assistant is connected and not rate-limited"""
+        if client.name in self.disconnected:
+            return False
+        return self.limited_until.get(client.name, 0) <= time.monotonic()
+    
+    def load(self, client: Client) -> float:
+        """Estimate an assistant's load from its chats, weighting CPU-heavy video calls"""
+        load = 0.0
+        for chat_id, name in self.assignments.items():
+            if name != client.name:
+                continue
+            state = self.player.chats.get(chat_id)
+            video = bool(state and state.current and state.current.is_video)
+            load += Config.VIDEO_CALL_WEIGHT if video else 1.0
+        return load
+    
+    def get_client(self, chat_id: int) -> Client:
+        """Get the assistant for a chat, keeping it sticky while that assistant is healthy"""
+        serving = self.player.calls.get_client(chat_id)
+        if serving and serving.name not in self.disconnected:
+            # Never split a live call across accounts
+            self.assignments[chat_id] = serving.name
+            return serving
+        
+        name = self.assignments.get(chat_id)
+        client = self.get(name) if name else None
+        if client and self.is_available(client):
+            return client
+        
+        candidates = [c for c in self.assistants if self.is_available(c)] or self.assistants
+        client = min(candidates, key=self.load)
+        
+        if name and name != client.name:
+            logger.info(f"Moving chat {chat_id} from {name} to {client.name}")
+            self.migrations += 1
+        self.assignments[chat_id] = client.name
+        return client
+    
+    def release(self, chat_id: int):
+        """Forget a chat's placement once it leaves the call"""
+        self.assignments.pop(chat_id, None)
+    
+    def mark_rate_limited(self, client: Client, seconds: float):
+        """Keep new placements off an assistant until its flood wait expires"""
+        self.limited_until[client.name] = time.monotonic() + seconds
+        logger.warning(f"Assistant {client.name} rate-limited for {seconds}s")
+    
+    def start_health_checks(self):
+        """Start watching assistant connections in the background"""
+        if self.health_task is None or self.health_task.done():
+            self.health_task = asyncio.create_task(self._health_loop())
+    
+    async def _health_loop(self):
+        """Detect disconnected assistants and move their chats elsewhere"""
+        while True:
+            try:
+                await asyncio.sleep(Config.ASSISTANT_HEALTH_INTERVAL)
+                for client in self.assistants:
+                    if client.is_connected:
+                        if client.name in self.disconnected:
+                            logger.info(f"Assistant {client.name} reconnected")
+                            self.disconnected.discard(client.name)
+                        continue
+                    
+                    if client.name not in self.disconnected:
+                        logger.warning(f"Assistant {client.name} disconnected")
+                        self.disconnected.add(client.name)
+                    await self._evacuate(client)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in assistant health check: {e}")
+    
+    async def _evacuate(self, client: Client):
+        """Move every active chat off an unavailable assistant"""
+        for chat_id in self.player.calls.chats_for(client):
+            new_client = self.get_client(chat_id)
+            if new_client is client:
+                continue
+            await self.player.migrate(chat_id, new_client)
+    
+    async def stop(self):
+        """Stop health checks"""
+        if self.health_task:
+            self.health_task.cancel()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get per-assistant placement statistics"""
+        now = time.monotonic()
+        return {
+            'assistants': {
+                client.name: {
+                    'load': self.load(client),
+                    'calls': len(self.player.calls.chats_for(client)),
+                    'connected': client.name not in self.disconnected,
+                    'rate_limited_for': max(0, round(self.limited_until.get(client.name, 0) - now))
+                } for client in self.assistants
+            },
+            'assigned_chats': len(self.assignments),
+            'migrations': self.migrations
+        }
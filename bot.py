@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 
 import os
+import io
+import json
 import asyncio
 import logging
 from pyrogram import Client, filters, idle
@@ -9,7 +11,11 @@ from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from config import Config
 from database import Database
 from music_player import MusicPlayer
-from utils import get_file_from_youtube, format_duration
+from assistant_pool import AssistantPool
+from callback_handlers import register_callback_handlers
+from utils import get_file_from_youtube, release_downloaded_file, format_duration, is_youtube_playlist, is_spotify_url
+from extractor import extractor
+from ydl_pool import ydl_pool
 import time
 import psutil
 
@@ -28,19 +34,25 @@ class TelegramMusicBot:
             api_hash=Config.API_HASH,
             bot_token=Config.BOT_TOKEN
         )
-        self.assistant = Client(
-            "assistant",
-            api_id=Config.API_ID,
-            api_hash=Config.API_HASH,
-            session_string=Config.SESSION_STRING
-        ) if Config.SESSION_STRING else None
+        self.assistants = [
+            Client(
+                "assistant" if i == 0 else f"assistant{i + 1}",
+                api_id=Config.API_ID,
+                api_hash=Config.API_HASH,
+                session_string=session_string
+            ) for i, session_string in enumerate(Config.SESSION_STRINGS)
+        ]
+        self.assistant = self.assistants[0] if self.assistants else None
         
         self.db = Database()
         self.music_player = MusicPlayer()
+        self.assistant_pool = AssistantPool(self.assistants, self.music_player) if self.assistants else None
+        self.music_player.assistant_pool = self.assistant_pool
         self.start_time = time.time()
         
         # Register handlers
         self.register_handlers()
+        self.callback_handlers = register_callback_handlers(self)
     
     def register_handlers(self):
         """Register all command handlers"""
@@ -85,6 +97,14 @@ class TelegramMusicBot:
         async def shuffle_command(client, message: Message):
             await self.handle_shuffle(message)
         
+        @self.app.on_message(filters.command("export"))
+        async def export_command(client, message: Message):
+            await self.handle_export(message)
+        
+        @self.app.on_message(filters.command("import"))
+        async def import_command(client, message: Message):
+            await self.handle_import(message)
+        
         @self.app.on_message(filters.command(["speed", "playback"]))
         async def speed_command(client, message: Message):
             await self.handle_speed(message)
@@ -272,6 +292,8 @@ Click the buttons below to explore all commands.
 • `/song` [song] - Download MP3/MP4
 • `/queue` or `/q` - Show queue
 • `/shuffle` - Shuffle queue
+• `/export` - Save queue as a file
+• `/import` - Load a queue file (reply to it)
 • `/stop` - Stop playback
 • `/loop` [1-10] - Set loop count
 
@@ -350,11 +372,10 @@ Use buttons below for detailed command categories!
             
             await processing_msg.delete()
             
-            # Clean up files
-            if os.path.exists(audio_file):
-                os.remove(audio_file)
-            if video_file and os.path.exists(video_file):
-                os.remove(video_file)
+            # Clean up files (kept until concurrent requests for the same song finish)
+            release_downloaded_file(audio_file)
+            if video_file:
+                release_downloaded_file(video_file)
                 
         except Exception as e:
             logger.error(f"Error in song download: {e}")
@@ -375,11 +396,17 @@ Use buttons below for detailed command categories!
         
         processing_msg = await message.reply_text("🔄 Adding to queue...")
         
+        if is_youtube_playlist(query) or is_spotify_url(query):
+            await self.queue_playlist(message, processing_msg, query)
+            return
+        
         try:
             result = await self.music_player.add_to_queue(chat_id, query, message.from_user)
             if result:
-                await processing_msg.edit_text(f"✅ Added to queue: **{result['title']}**")
-                await self.music_player.play_next(chat_id, self.assistant or self.app)
+                await processing_msg.edit_text(f"✅ Added to queue: **{result.title}**")
+                await self.music_player.play_if_idle(chat_id, self.get_call_client(chat_id))
+            elif not extractor.available('youtube'):
+                await processing_msg.edit_text("❌ YouTube is not responding right now, please try again shortly!")
             else:
                 await processing_msg.edit_text("❌ Song not found!")
         except Exception as e:
@@ -400,17 +427,58 @@ Use buttons below for detailed command categories!
         
         processing_msg = await message.reply_text("🔄 Adding video to queue...")
         
+        if is_youtube_playlist(query) or is_spotify_url(query):
+            await self.queue_playlist(message, processing_msg, query, video=True)
+            return
+        
         try:
             result = await self.music_player.add_to_queue(chat_id, query, message.from_user, video=True)
             if result:
-                await processing_msg.edit_text(f"✅ Added video to queue: **{result['title']}**")
-                await self.music_player.play_next(chat_id, self.assistant or self.app)
+                await processing_msg.edit_text(f"✅ Added video to queue: **{result.title}**")
+                await self.music_player.play_if_idle(chat_id, self.get_call_client(chat_id))
+            elif not extractor.available('youtube'):
+                await processing_msg.edit_text("❌ YouTube is not responding right now, please try again shortly!")
             else:
                 await processing_msg.edit_text("❌ Video not found!")
         except Exception as e:
             logger.error(f"Error in vplay command: {e}")
             await processing_msg.edit_text("❌ An error occurred!")
     
+    async def queue_playlist(self, message: Message, processing_msg: Message, url: str, video: bool = False):
+        """Queue a YouTube playlist or Spotify link, reporting progress as tracks arrive"""
+        chat_id = message.chat.id
+        last_update = 0.0
+        
+        async def progress(added: int, total: int = 0):
+            nonlocal last_update
+            if time.monotonic() - last_update < 2:
+                return
+            last_update = time.monotonic()
+            count = f"{added}/{total}" if total else str(added)
+            await processing_msg.edit_text(f"🔄 Queued {count} track(s) from playlist...")
+        
+        try:
+            if is_spotify_url(url):
+                if not self.music_player.spotify.enabled:
+                    await processing_msg.edit_text("❌ Spotify is not configured!")
+                    return
+                add = self.music_player.add_spotify
+            else:
+                add = self.music_player.add_playlist
+            
+            added = await add(
+                chat_id, url, message.from_user, video=video,
+                client=self.get_call_client(chat_id),
+                progress=progress
+            )
+            if added:
+                await processing_msg.edit_text(f"✅ Added {added} track(s) from playlist")
+            else:
+                await processing_msg.edit_text("❌ Playlist is empty or the queue is full!")
+        except Exception as e:
+            logger.error(f"Error queueing playlist: {e}")
+            await processing_msg.edit_text("❌ An error occurred!")
+    
     async def handle_playforce(self, message: Message):
         """Handle /playforce command"""
         if len(message.command) < 2:
@@ -450,7 +518,7 @@ Use buttons below for detailed command categories!
         if not await self.can_use_bot(message):
             return
         
-        await self.music_player.stop(chat_id, self.assistant or self.app)
+        await self.music_player.stop(chat_id, self.get_call_client(chat_id))
         await message.reply_text("⏹️ Stopped playback and cleared queue!")
     
     async def handle_queue(self, message: Message):
@@ -464,8 +532,8 @@ Use buttons below for detailed command categories!
         
         queue_text = "🎵 **Current Queue:**\n\n"
         for i, track in enumerate(queue[:10], 1):
-            queue_text += f"{i}. **{track['title']}**\n"
-            queue_text += f"   👤 Requested by: {track['requester']['first_name']}\n\n"
+            queue_text += f"{i}. **{track.title}**\n"
+            queue_text += f"   👤 Requested by: {track.requester.first_name}\n\n"
         
         if len(queue) > 10:
             queue_text += f"... and {len(queue) - 10} more tracks"
@@ -485,6 +553,60 @@ Use buttons below for detailed command categories!
         else:
             await message.reply_text("❌ Queue is empty!")
     
+    async def handle_export(self, message: Message):
+        """Handle /export command"""
+        queue = await self.music_player.export_queue(message.chat.id)
+        if not queue:
+            await message.reply_text("📭 Queue is empty!")
+            return
+        
+        document = io.BytesIO(json.dumps(queue, ensure_ascii=False, indent=2).encode())
+        document.name = "queue.json"
+        await message.reply_document(document, caption=f"📋 {len(queue)} track(s)")
+    
+    async def handle_import(self, message: Message):
+        """Handle /import command"""
+        chat_id = message.chat.id
+        
+        if not await self.can_use_bot(message):
+            return
+        
+        reply = message.reply_to_message
+        if not reply or not reply.document:
+            await message.reply_text("❌ Reply to a queue file from /export!")
+            return
+        
+        try:
+            document = await reply.download(in_memory=True)
+            queue_data = json.loads(bytes(document.getbuffer()).decode())
+            if not isinstance(queue_data, list):
+                raise ValueError("queue file must contain a list")
+        except Exception as e:
+            logger.error(f"Error reading queue file: {e}")
+            await message.reply_text("❌ Invalid queue file!")
+            return
+        
+        status_msg = await message.reply_text(f"🔄 Importing 0/{len(queue_data)}...")
+        last_update = 0.0
+        
+        async def progress(done: int, total: int):
+            nonlocal last_update
+            # Telegram rate-limits edits, so only refresh every couple of seconds
+            if done < total and time.monotonic() - last_update < 2:
+                return
+            last_update = time.monotonic()
+            await status_msg.edit_text(f"🔄 Importing {done}/{total}...")
+        
+        added = await self.music_player.import_queue(
+            chat_id, queue_data, message.from_user,
+            client=self.get_call_client(chat_id),
+            progress=progress
+        )
+        if added:
+            await status_msg.edit_text(f"✅ Imported {added} track(s)")
+        else:
+            await status_msg.edit_text("❌ Nothing imported (queue full or no tracks found)")
+    
     async def handle_speed(self, message: Message):
         """Handle /speed command"""
         if len(message.command) < 2:
@@ -713,6 +835,7 @@ Use buttons below for detailed command categories!
         total_chats = await self.db.get_total_chats()
         uptime = time.time() - self.start_time
         uptime_str = format_duration(int(uptime))
+        extractor_stats = extractor.get_stats()
         
         stats_text = f"""
 📊 **Bot Statistics**
@@ -722,6 +845,11 @@ Use buttons below for detailed command categories!
 • Chats: {total_chats}
 • Uptime: {uptime_str}
 
+**🔎 Extractor:**
+• Workers: {extractor_stats['running']}/{extractor_stats['workers']} busy
+• Queued: {extractor_stats['queued']}
+• Avg Wait: {extractor_stats['avg_wait_ms']} ms (max {extractor_stats['max_wait_ms']} ms)
+
 **💻 System Stats:**
 • CPU: {cpu_percent}%
 • RAM: {memory.percent}% ({memory.used//1024//1024} MB / {memory.total//1024//1024} MB)
@@ -1133,30 +1261,59 @@ Use buttons below for detailed command categories!
         
         return True
     
+    def get_call_client(self, chat_id: int) -> Client:
+        """Get the client that should serve a chat's voice call"""
+        if self.assistant_pool:
+            return self.assistant_pool.get_client(chat_id)
+        return self.app
+    
     async def run(self):
         """Start the bot"""
         logger.info("Starting Music Bot...")
         
-        # Start assistant if available
-        if self.assistant:
-            await self.assistant.start()
-            logger.info("Assistant started")
+        # Start assistants if available
+        for assistant in self.assistants:
+            await assistant.start()
+            logger.info(f"Assistant {assistant.name} started")
         
         # Start main bot
         await self.app.start()
         logger.info("Bot started successfully!")
         
+        # Start the shared voice call clients up front so the first /play doesn't pay for it
+        for client in self.assistants or [self.app]:
+            await self.music_player.calls.get_instance(client)
+        if self.assistant_pool:
+            self.assistant_pool.start_health_checks()
+        
+        # Pick up chats that were playing before the restart; other chats load lazily
+        asyncio.create_task(self.music_player.resume_sessions(self.get_call_client))
+        
         # Keep the bot running
         await idle()
     
     async def stop(self):
         """Stop the bot"""
         logger.info("Stopping bot...")
+        await self.music_player.save_sessions()
         
-        if self.assistant:
-            await self.assistant.stop()
-        
-        await self.app.stop()
+        try:
+            if self.assistant_pool:
+                await self.assistant_pool.stop()
+            for assistant in self.assistants:
+                await assistant.stop()
+            
+            await self.app.stop()
+        finally:
+            # Buffered queue writes are flushed even if a client failed to stop;
+            # the prefetcher goes first as it hands its results to the actors
+            await self.music_player.prefetcher.close()
+            await self.music_player.actors.close()
+            await self.music_player.db.close()
+        await self.music_player.spotify.close()
+        await self.music_player.youtube_search.close()
+        extractor.shutdown()
+        ydl_pool.close()
         logger.info("Bot stopped")
 
 if __name__ == "__main__":
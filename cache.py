@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+def normalize_query(query: str) -> str:
+    """Normalize a search query so trivial variations share a cache key"""
+    query = query.strip()
+    if query.startswith('http'):
+        # Video IDs are case-sensitive and may contain '-' or '_'
+        return query
+    query = re.sub(r'[^\w\s]', ' ', query.lower())
+    return ' '.join(query.split())
+
+class SearchCache:
+    """TTL + LRU cache of search results, split by audio/video mode"""
+    
+    def __init__(self, db=None, max_size: int = Config.SEARCH_CACHE_SIZE,
+                 ttl: int = Config.SEARCH_CACHE_TTL, persist: bool = Config.SEARCH_CACHE_PERSIST):
+        self.db = db
+        self.max_size = max_size
+        self.ttl = ttl
+        self.persist = persist and db is not None
+        self.entries: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self._loaded = not self.persist
+        self._load_lock = asyncio.Lock()
+    
+    @staticmethod
+    def make_key(query: str, video: bool) -> Tuple[str, str]:
+        """Build the cache key for a query"""
+        return ('video' if video else 'audio', normalize_query(query))
+    
+    async def get(self, query: str, video: bool = False) -> Optional[Dict[str, Any]]:
+        """Get a cached result, or None on miss or expiry"""
+        await self._ensure_loaded()
+        key = self.make_key(query, video)
+        entry = self.entries.get(key)
+        
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        expires_at, data = entry
+        if expires_at <= time.time():
+            # Kept until evicted, get_stale may still need it
+            self.misses += 1
+            return None
+        
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return dict(data)
+    
+    def get_stale(self, query: str, video: bool = False) -> Optional[Dict[str, Any]]:
+        """Get a cached result even if it expired, for when the source cannot be searched"""
+        entry = self.entries.get(self.make_key(query, video))
+        if entry is None:
+            return None
+        self.stale_hits += 1
+        return dict(entry[1])
+    
+    async def put(self, query: str, video: bool, data: Dict[str, Any]):
+        """Store a result and persist it if enabled"""
+        await self._ensure_loaded()
+        key = self.make_key(query, video)
+        expires_at = time.time() + self.ttl
+        self._store(key, expires_at, dict(data))
+        
+        if self.persist:
+            try:
+                await self.db.save_search_cache(key[0], key[1], data, expires_at)
+            except Exception as e:
+                logger.error(f"Error persisting search cache: {e}")
+    
+    def _store(self, key: Tuple[str, str], expires_at: float, data: Dict[str, Any]):
+        """Insert into the LRU, evicting the least recently used entries"""
+        self.entries[key] = (expires_at, data)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+    
+    async def _ensure_loaded(self):
+        """Load persisted entries once, on first use"""
+        if self._loaded:
+            return
+        
+        async with self._load_lock:
+            if self._loaded:
+                return
+            try:
+                rows = await self.db.load_search_cache(self.max_size)
+                for mode, query_key, data, expires_at in rows:
+                    self._store((mode, query_key), expires_at, data)
+                logger.info(f"Loaded {len(rows)} cached searches")
+            except Exception as e:
+                logger.error(f"Error loading search cache: {e}")
+            self._loaded = True
+    
+    def clear(self):
+        """Drop all in-memory entries"""
+        self.entries.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache hit/miss statistics"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale_hits': self.stale_hits,
+            'hit_rate': round(self.hits / lookups * 100, 1) if lookups else 0.0
+        }
+
+def parse_url_expiry(url: str) -> Optional[float]:
+    """Get the expiry timestamp embedded in a direct stream URL, if any"""
+    try:
+        parsed = urlparse(url)
+        expire = parse_qs(parsed.query).get('expire')
+        if expire:
+            return float(expire[0])
+        
+        # HLS/DASH manifests carry it as a path segment: /expire/<ts>/
+        match = re.search(r'/expire/(\d+)', parsed.path)
+        if match:
+            return float(match.group(1))
+    except (ValueError, TypeError):
+        pass
+    return None
+
+class StreamURLCache:
+    """Cache of resolved direct stream URLs that honours their expiry"""
+    
+    def __init__(self, max_size: int = Config.STREAM_URL_CACHE_SIZE,
+                 margin: int = Config.STREAM_URL_REFRESH_MARGIN,
+                 default_ttl: int = Config.STREAM_URL_DEFAULT_TTL):
+        self.max_size = max_size
+        self.margin = margin
+        self.default_ttl = default_ttl
+        self.entries: "OrderedDict[Tuple[str, bool], Tuple[float, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.resolutions = 0
+    
+    def expires_at(self, url: str) -> float:
+        """Get when a URL expires, assuming the default TTL if unknown"""
+        expiry = parse_url_expiry(url)
+        return expiry if expiry is not None else time.time() + self.default_ttl
+    
+    def is_fresh(self, url: str, valid_for: float = 0) -> bool:
+        """Check a URL will still be valid after valid_for seconds"""
+        expiry = parse_url_expiry(url)
+        if expiry is None:
+            # Local files and URLs without an expiry never go stale
+            return True
+        return expiry - self.margin - valid_for > time.time()
+    
+    def get(self, webpage_url: str, video: bool = False, valid_for: float = 0) -> Optional[str]:
+        """Get a cached stream URL that is still fresh"""
+        key = (webpage_url, video)
+        entry = self.entries.get(key)
+        
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        expires_at, url = entry
+        if expires_at - self.margin - valid_for <= time.time():
+            del self.entries[key]
+            self.misses += 1
+            return None
+        
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return url
+    
+    def put(self, webpage_url: str, video: bool, url: str):
+        """Store a freshly resolved stream URL"""
+        key = (webpage_url, video)
+        self.entries[key] = (self.expires_at(url), url)
+        self.entries.move_to_end(key)
+        self.resolutions += 1
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+    
+    def invalidate(self, webpage_url: str, video: bool = False):
+        """Forget a stream URL, e.g. after playback failed with it"""
+        self.entries.pop((webpage_url, video), None)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get stream URL cache statistics"""
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'resolutions': self.resolutions
+        }
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from pyrogram import Client
+from pytgcalls import PyTgCalls
+
+logger = logging.getLogger(__name__)
+
+class CallManager:
+    """Keeps one PyTgCalls instance per client and multiplexes group calls through it"""
+    
+    def __init__(self, on_stream_end: Callable[[int, Client], Awaitable[None]],
+                 on_closed: Callable[[int], Awaitable[None]]):
+        self.on_stream_end = on_stream_end
+        self.on_closed = on_closed
+        self.instances: Dict[int, PyTgCalls] = {}
+        self.clients: Dict[int, Client] = {}
+        self.chat_calls: Dict[int, int] = {}
+        self.startup_times: Dict[int, float] = {}
+        self._lock = asyncio.Lock()
+    
+    async def get_instance(self, client: Client) -> PyTgCalls:
+        """Get the PyTgCalls instance for a client, starting it on first use"""
+        key = id(client)
+        pytgcalls = self.instances.get(key)
+        if pytgcalls:
+            return pytgcalls
+        
+        async with self._lock:
+            if key in self.instances:
+                return self.instances[key]
+            
+            started = time.monotonic()
+            pytgcalls = PyTgCalls(client)
+            
+            @pytgcalls.on_stream_end()
+            async def on_stream_end(_, update):
+                await self.on_stream_end(update.chat_id, client)
+            
+            @pytgcalls.on_closed_voice_chat()
+            async def on_closed_vc(_, update):
+                self.detach(update.chat_id)
+                await self.on_closed(update.chat_id)
+            
+            @pytgcalls.on_kicked()
+            async def on_kicked(_, update):
+                self.detach(update.chat_id)
+                await self.on_closed(update.chat_id)
+            
+            @pytgcalls.on_left()
+            async def on_left(_, update):
+                self.detach(update.chat_id)
+            
+            await pytgcalls.start()
+            self.instances[key] = pytgcalls
+            self.clients[key] = client
+            self.startup_times[key] = time.monotonic() - started
+            logger.info(f"PyTgCalls started for {client.name} in {self.startup_times[key]:.2f}s")
+            return pytgcalls
+    
+    def attach(self, chat_id: int, client: Client):
+        """Record that a chat's group call is served by this client"""
+        self.chat_calls[chat_id] = id(client)
+    
+    def detach(self, chat_id: int):
+        """Forget a chat's group call"""
+        self.chat_calls.pop(chat_id, None)
+    
+    def get(self, chat_id: int) -> Optional[PyTgCalls]:
+        """Get the PyTgCalls instance serving a chat, if it is in a call"""
+        key = self.chat_calls.get(chat_id)
+        return self.instances.get(key) if key is not None else None
+    
+    def get_client(self, chat_id: int) -> Optional[Client]:
+        """Get the client serving a chat, if it is in a call"""
+        key = self.chat_calls.get(chat_id)
+        return self.clients.get(key) if key is not None else None
+    
+    def is_active(self, chat_id: int) -> bool:
+        """Check whether a chat is in a group call"""
+        return chat_id in self.chat_calls
+    
+    def chats_for(self, client: Client) -> List[int]:
+        """Get the chats currently served by a client"""
+        key = id(client)
+        return [chat_id for chat_id, owner in self.chat_calls.items() if owner == key]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get call bookkeeping statistics"""
+        return {
+            'instances': len(self.instances),
+            'active_calls': len(self.chat_calls),
+            'calls_per_instance': {
+                client.name: len(self.chats_for(client)) for client in self.clients.values()
+            },
+            'startup_seconds': {
+                self.clients[key].name: round(t, 2) for key, t in self.startup_times.items()
+            }
+        }
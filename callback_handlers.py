@@ -56,6 +56,10 @@ class CallbackHandlers:
                     await self.handle_queue_action(callback_query, data)
                 elif data.startswith("player_"):
                     await self.handle_player_action(callback_query, data)
+                elif data.startswith("vol_"):
+                    await self.handle_volume_callback(callback_query, data)
+                elif data.startswith("speed_"):
+                    await self.handle_speed_callback(callback_query, data)
                 else:
                     await callback_query.answer("❓ Unknown command!", show_alert=True)
                     
@@ -220,14 +224,14 @@ Coming soon on YouTube!
         
         if current_track:
             text += f"**🎧 Now Playing:**\n"
-            text += f"📀 {current_track['title']}\n"
-            text += f"👤 Requested by: {current_track['requester']['first_name']}\n\n"
+            text += f"📀 {current_track.title}\n"
+            text += f"👤 Requested by: {current_track.requester.first_name}\n\n"
         else:
             text += "**⏸️ Nothing is playing**\n\n"
         
         if queue:
             text += f"**📋 Queue:** {len(queue)} track(s)\n"
-            text += f"**⏱️ Total Duration:** {sum(track.get('duration', 0) for track in queue) // 60}m\n\n"
+            text += f"**⏱️ Total Duration:** {sum(track.duration for track in queue) // 60}m\n\n"
         
         text += "**🎛️ Available Controls:**\n"
         text += "• Play/Pause/Stop playback\n"
@@ -462,8 +466,8 @@ Click the buttons below to explore all features.
             
             text = "📋 **Current Queue:**\n\n"
             for i, track in enumerate(queue[:10], 1):
-                text += f"{i}. **{track['title'][:30]}{'...' if len(track['title']) > 30 else ''}**\n"
-                text += f"   👤 {track['requester']['first_name']}\n\n"
+                text += f"{i}. **{track.title[:30]}{'...' if len(track.title) > 30 else ''}**\n"
+                text += f"   👤 {track.requester.first_name}\n\n"
             
             if len(queue) > 10:
                 text += f"... and {len(queue) - 10} more tracks"
@@ -511,11 +515,11 @@ Click the buttons below to explore all features.
                 await callback_query.answer("❌ Nothing is paused!", show_alert=True)
                 
         elif action == "stop":
-            await self.bot.music_player.stop(chat_id, self.bot.assistant or self.bot.app)
+            await self.bot.music_player.stop(chat_id, self.bot.get_call_client(chat_id))
             await callback_query.answer("⏹️ Playback stopped!")
             
         elif action == "skip":
-            await self.bot.music_player.skip_track(chat_id, self.bot.assistant or self.bot.app)
+            await self.bot.music_player.skip_track(chat_id, self.bot.get_call_client(chat_id))
             await callback_query.answer("⏭️ Track skipped!")
             
         elif action == "loop":
@@ -762,3 +766,54 @@ def register_callback_handlers(bot_instance):
     """Register callback handlers with the bot"""
     callback_handlers = CallbackHandlers(bot_instance)
     return callback_handlers
+
+if __name__ == "__main__":
+    import asyncio
+    from types import SimpleNamespace
+    
+    class FakeApp:
+        def on_callback_query(self):
+            def decorator(func):
+                self.callback = func
+                return func
+            return decorator
+    
+    class FakeDB:
+        async def is_gbanned(self, user_id):
+            return False
+    
+    class FakePlayer:
+        def __init__(self):
+            self.calls = []
+        
+        async def set_speed(self, chat_id, speed):
+            self.calls.append(('speed', chat_id, speed))
+            return True
+        
+        async def set_volume(self, chat_id, volume):
+            self.calls.append(('volume', chat_id, volume))
+            return True
+    
+    class FakeQuery:
+        def __init__(self, data):
+            self.data = data
+            self.from_user = SimpleNamespace(id=1)
+            self.message = SimpleNamespace(chat=SimpleNamespace(id=-100))
+            self.answers = []
+        
+        async def answer(self, text=None, show_alert=False):
+            self.answers.append(text)
+    
+    async def test_speed_callback():
+        bot = SimpleNamespace(app=FakeApp(), db=FakeDB(), music_player=FakePlayer())
+        register_callback_handlers(bot)
+        
+        for data in ["speed_1.5", "vol_50"]:
+            query = FakeQuery(data)
+            await bot.app.callback(None, query)
+            print(f"{data!r:12} -> {query.answers}")
+        
+        assert bot.music_player.calls == [('speed', -100, 1.5), ('volume', -100, 50)], bot.music_player.calls
+        print("speed and volume callbacks reached the player")
+    
+    asyncio.run(test_speed_callback())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import contextvars
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class ChatActor:
+    """Runs one chat's player operations one at a time from a mailbox"""
+    
+    def __init__(self, chat_id: int, registry: "ChatActors"):
+        self.chat_id = chat_id
+        self.registry = registry
+        self.mailbox: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+        self.processed = 0
+    
+    def start(self):
+        """Start the actor's worker task"""
+        # From a fresh context, so the actor does not keep the extraction
+        # priority of whichever task happened to submit to it first
+        self.task = contextvars.Context().run(asyncio.create_task, self._run())
+    
+    async def _run(self):
+        """Handle queued operations in order until idle for too long"""
+        try:
+            if self.registry.on_start:
+                try:
+                    await self.registry.on_start(self.chat_id)
+                except Exception as e:
+                    logger.error(f"Error starting actor for {self.chat_id}: {e}")
+            
+            while True:
+                try:
+                    func, args, future = await asyncio.wait_for(
+                        self.mailbox.get(), self.registry.idle_timeout
+                    )
+                except asyncio.TimeoutError:
+                    if self.mailbox.empty():
+                        # Idle, let the registry start a fresh actor on the next message
+                        break
+                    continue
+                
+                if future.cancelled():
+                    continue
+                
+                try:
+                    result = await func(*args)
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                except Exception as e:
+                    if not future.cancelled():
+                        future.set_exception(e)
+                else:
+                    if not future.cancelled():
+                        future.set_result(result)
+                self.processed += 1
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.registry._forget(self)
+            # Nothing will run what is left, fail it instead of hanging callers
+            while not self.mailbox.empty():
+                _, _, future = self.mailbox.get_nowait()
+                if not future.done():
+                    future.cancel()
+
+class ChatActors:
+    """Per-chat actors: operations on one chat are serialized, different chats run in parallel"""
+    
+    def __init__(self, idle_timeout: float = Config.ACTOR_IDLE_TIMEOUT,
+                 on_start: Optional[Callable[[int], Awaitable[None]]] = None):
+        self.idle_timeout = idle_timeout
+        self.on_start = on_start
+        self.actors: Dict[int, ChatActor] = {}
+        self.started = 0
+        self.reaped = 0
+        self.processed = 0
+    
+    async def submit(self, chat_id: int, func: Callable[..., Awaitable[Any]], *args) -> Any:
+        """Run func(*args) on the chat's actor and wait for its result"""
+        actor = self.actors.get(chat_id)
+        if actor and actor.task is asyncio.current_task():
+            # Already inside this chat's actor, queueing would deadlock
+            return await func(*args)
+        
+        if actor is None:
+            actor = ChatActor(chat_id, self)
+            self.actors[chat_id] = actor
+            actor.start()
+            self.started += 1
+        
+        future = asyncio.get_running_loop().create_future()
+        actor.mailbox.put_nowait((func, args, future))
+        return await future
+    
+    def _forget(self, actor: ChatActor):
+        """Drop a stopped actor from the registry"""
+        if self.actors.get(actor.chat_id) is actor:
+            del self.actors[actor.chat_id]
+        self.processed += actor.processed
+        self.reaped += 1
+    
+    async def close(self):
+        """Stop every actor"""
+        for actor in list(self.actors.values()):
+            if actor.task:
+                actor.task.cancel()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get actor statistics"""
+        return {
+            'actors': len(self.actors),
+            'started': self.started,
+            'reaped': self.reaped,
+            'processed': self.processed + sum(a.processed for a in self.actors.values()),
+            'max_mailbox': max((a.mailbox.qsize() for a in self.actors.values()), default=0)
+        }
@@ -17,6 +17,14 @@ class Config:
     # Assistant account session string (optional)
     SESSION_STRING = os.getenv("SESSION_STRING", "")
     
+    # Extra assistant session strings (comma separated) for spreading voice chats,
+    # each account once even if SESSION_STRING is listed again
+    SESSION_STRINGS: List[str] = list(dict.fromkeys(
+        x.strip() for x in [SESSION_STRING] + os.getenv("SESSION_STRINGS", "").split(",") if x.strip()
+    ))
+    ASSISTANT_HEALTH_INTERVAL = 30  # seconds between assistant connection checks
+    VIDEO_CALL_WEIGHT = 3.0  # video calls cost roughly this many audio calls in CPU
+    
     # Owner/Sudo users (comma separated user IDs)
     SUDO_USERS_STR = os.getenv("SUDO_USERS", "YOUR_USER_ID")
     SUDO_USERS: List[int] = [int(x.strip()) for x in SUDO_USERS_STR.split(",") if x.strip().isdigit()]
@@ -38,7 +46,8 @@ class Config:
         'quiet': True,
         'no_warnings': True,
         'default_search': 'auto',
-        'source_address': '0.0.0.0'
+        'source_address': '0.0.0.0',
+        'socket_timeout': 15  # lets abandoned extractions give up soon after their deadline
     }
     
     YTDL_VIDEO_OPTS = {
@@ -52,7 +61,8 @@ class Config:
         'quiet': True,
         'no_warnings': True,
         'default_search': 'auto',
-        'source_address': '0.0.0.0'
+        'source_address': '0.0.0.0',
+        'socket_timeout': 15
     }
     
     # Bot settings
@@ -69,13 +79,87 @@ class Config:
     # Spotify configuration (optional)
     SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID", "")
     SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET", "")
+    SPOTIFY_API_URL = os.getenv("SPOTIFY_API_URL", "https://api.spotify.com")
+    SPOTIFY_AUTH_URL = os.getenv("SPOTIFY_AUTH_URL", "https://accounts.spotify.com/api/token")
+    SPOTIFY_MATCH_CONCURRENCY = 4  # YouTube searches run at once when matching Spotify tracks
     
     # Other streaming services (optional)
     SOUNDCLOUD_CLIENT_ID = os.getenv("SOUNDCLOUD_CLIENT_ID", "")
     
     # Performance settings
-    MAX_CONCURRENT_DOWNLOADS = 3
+    MAX_CONCURRENT_DOWNLOADS = int(os.getenv("MAX_CONCURRENT_DOWNLOADS", 3))
     DOWNLOAD_TIMEOUT = 300  # 5 minutes
+    EXTRACT_TIMEOUT = int(os.getenv("EXTRACT_TIMEOUT", 30))  # deadline for searches and stream URL resolution
+    EXTRACT_QUEUE_TIMEOUT = int(os.getenv("EXTRACT_QUEUE_TIMEOUT", 120))  # longest wait for a free slot, before the deadline starts
+    # Jobs running at once per source, sources without an entry use 'default'
+    EXTRACT_LIMITS = {
+        'youtube': MAX_CONCURRENT_DOWNLOADS,
+        'youtube_download': MAX_CONCURRENT_DOWNLOADS,  # downloads hold slots for minutes, kept apart from lookups
+        'soundcloud': 2,
+        'default': MAX_CONCURRENT_DOWNLOADS
+    }
+    
+    # Reusable YoutubeDL instances
+    YTDL_POOL_IDLE = 4  # idle instances kept per set of options
+    YTDL_POOL_MAX_USES = int(os.getenv("YTDL_POOL_MAX_USES", 50))  # jobs an instance serves before it is rebuilt
+    
+    # Circuit breaker per extraction source
+    BREAKER_WINDOW = 60  # seconds of calls the error rate is measured over
+    BREAKER_MIN_CALLS = 5  # calls needed in the window before the breaker can trip
+    BREAKER_ERROR_RATE = 0.5  # share of failed calls that trips the breaker
+    BREAKER_SLOW_CALL = 20  # extractions slower than this many seconds count as failures
+    BREAKER_OPEN_SECONDS = 15  # first pause after tripping, doubled after each failed probe
+    BREAKER_MAX_OPEN_SECONDS = 300
+    BREAKER_PROBES = 2  # trial calls that must succeed before the breaker closes
+    
+    # Search result cache
+    SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", 1000))
+    SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", 3 * 3600))  # 3 hours
+    SEARCH_CACHE_PERSIST = os.getenv("SEARCH_CACHE_PERSIST", "true").lower() == "true"
+    
+    # Search sources, the first is primary and the rest are hedged against it
+    SEARCH_SOURCES = [s.strip() for s in os.getenv("SEARCH_SOURCES", "youtube,soundcloud").split(",") if s.strip()]
+    SEARCH_HEDGE_DELAY = 2.0  # seconds before hedging until the primary has enough samples
+    SEARCH_HEDGE_MIN_DELAY = 0.5
+    SEARCH_HEDGE_MAX_DELAY = 5.0
+    SEARCH_HEDGE_PERCENTILE = 0.9  # hedge once the primary is slower than this share of its recent searches
+    SEARCH_HEDGE_MIN_SAMPLES = 10
+    SEARCH_STATS_WINDOW = 100  # recent searches kept per source
+    
+    # Native YouTube search, yt-dlp is only used when a results page cannot be parsed
+    YOUTUBE_NATIVE_SEARCH = os.getenv("YOUTUBE_NATIVE_SEARCH", "true").lower() == "true"
+    YOUTUBE_BASE_URL = os.getenv("YOUTUBE_BASE_URL", "https://www.youtube.com")
+    YOUTUBE_SEARCH_TIMEOUT = 10  # seconds per results page request
+    YOUTUBE_SEARCH_CONNECTIONS = 10  # pooled HTTP connections to YouTube
+    
+    # Fuzzy index of played tracks, consulted before searching YouTube
+    TRACK_INDEX_ENABLED = os.getenv("TRACK_INDEX_ENABLED", "true").lower() == "true"
+    TRACK_INDEX_MIN_SCORE = float(os.getenv("TRACK_INDEX_MIN_SCORE", 0.8))  # share of query trigrams a match must contain
+    TRACK_INDEX_MIN_SIMILARITY = float(os.getenv("TRACK_INDEX_MIN_SIMILARITY", 0.6))  # Dice similarity of query and track
+    TRACK_INDEX_CANDIDATES = 20  # indexed tracks scored per query
+    
+    # Direct stream URL cache
+    STREAM_URL_CACHE_SIZE = 500
+    STREAM_URL_REFRESH_MARGIN = 60  # treat URLs as stale this many seconds early
+    STREAM_URL_DEFAULT_TTL = 3600  # for URLs without an expire parameter
+    STREAM_PREFETCH_LEAD = 30  # refresh the next track this long before it starts
+    RESOLVE_LOOKAHEAD = int(os.getenv("RESOLVE_LOOKAHEAD", 2))  # tracks after the current one to pre-resolve
+    
+    # Lookahead prefetcher
+    PREFETCH_VALIDATE = True  # probe prefetched URLs before they play
+    PREFETCH_DOWNLOAD = os.getenv("PREFETCH_DOWNLOAD", "false").lower() == "true"  # buffer the next track locally
+    PREFETCH_IDLE_TIMEOUT = 300  # stop a chat's prefetcher after this long with an empty queue
+    TRANSITION_TARGET_MS = int(os.getenv("TRANSITION_TARGET_MS", 300))  # warn when a track takes longer to start
+    
+    # Playback controls
+    SPEED_DEBOUNCE = 0.4  # seconds to wait for more speed presses before restarting the stream
+    ACTOR_IDLE_TIMEOUT = 120  # stop a chat's command actor after this long without messages
+    
+    # Queue persistence
+    QUEUE_FLUSH_INTERVAL = 0.5  # seconds between batched queue writes
+    QUEUE_FLUSH_SIZE = 200  # flush early once this many queue writes are buffered
+    IMPORT_CONCURRENCY = 4  # entries resolved at once when importing a queue
+    PLAYLIST_PAGE_SIZE = 50  # playlist entries extracted per yt-dlp call
     
     # Security settings
     ALLOWED_EXTENSIONS = ['.mp3', '.mp4', '.wav', '.flac', '.ogg']
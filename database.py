@@ -5,22 +5,161 @@ import asyncio
 import sqlite3
 import json
 import logging
-from typing import List, Dict, Any, Optional
+import time
+from typing import List, Dict, Any, Iterable, Optional, Tuple
 from datetime import datetime
 import aiosqlite
 
 logger = logging.getLogger(__name__)
 
+class QueueJournal:
+    """Write-behind buffer that persists queue mutations in batched transactions"""
+    
+    def __init__(self, db_path: str, flush_interval: float = 0.5, max_pending: int = 200):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending: List[Tuple] = []
+        self.next_positions: Dict[int, int] = {}
+        self.flush_task: Optional[asyncio.Task] = None
+        self.wakeup: Optional[asyncio.Event] = None
+        self.lock = asyncio.Lock()
+        
+        # Journal statistics
+        self.flushes = 0
+        self.flushed_ops = 0
+        self.last_flush_ms = 0.0
+    
+    async def next_position(self, chat_id: int) -> int:
+        """Allocate the next queue position for a chat without touching the database"""
+        if chat_id not in self.next_positions:
+            async with aiosqlite.connect(self.db_path) as db:
+                cursor = await db.execute("""
+                    SELECT COALESCE(MAX(position), 0) + 1 FROM queue WHERE chat_id = ?
+                """, (chat_id,))
+                position = (await cursor.fetchone())[0]
+            # Another caller may have seeded it while we were reading
+            self.next_positions.setdefault(chat_id, position)
+        
+        position = self.next_positions[chat_id]
+        self.next_positions[chat_id] = position + 1
+        return position
+    
+    def append(self, op: Tuple):
+        """Buffer one mutation and make sure a flush is scheduled"""
+        self.pending.append(op)
+        if op[0] == 'clear':
+            self.next_positions[op[1]] = 1
+        
+        if self.flush_task is None or self.flush_task.done():
+            self.wakeup = asyncio.Event()
+            self.flush_task = asyncio.create_task(self._run())
+        if len(self.pending) >= self.max_pending:
+            self.wakeup.set()
+    
+    async def _run(self):
+        """Flush pending mutations every interval, or sooner once the buffer fills up"""
+        try:
+            while self.pending:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeup.clear()
+                await self.flush()
+        except asyncio.CancelledError:
+            pass
+    
+    async def flush(self):
+        """Write every buffered mutation in a single transaction"""
+        async with self.lock:
+            if not self.pending:
+                return
+            ops, self.pending = self.pending, []
+            started = time.monotonic()
+            
+            try:
+                async with aiosqlite.connect(self.db_path) as db:
+                    for op in ops:
+                        await self._apply(db, op)
+                    await db.commit()
+            except asyncio.CancelledError:
+                # Cancelled mid-write, put the batch back so it is not lost
+                self.pending = ops + self.pending
+                raise
+            except Exception as e:
+                logger.error(f"Error flushing queue journal: {e}")
+                # Keep the batch so the next flush retries it in order
+                self.pending = ops + self.pending
+                return
+            
+            self.flushes += 1
+            self.flushed_ops += len(ops)
+            self.last_flush_ms = round((time.monotonic() - started) * 1000, 1)
+    
+    async def _apply(self, db: aiosqlite.Connection, op: Tuple):
+        """Execute one buffered mutation on an open connection"""
+        kind, chat_id = op[0], op[1]
+        if kind == 'add':
+            position, track_data = op[2], op[3]
+            await db.execute("""
+                INSERT INTO queue (
+                    chat_id, title, url, duration, requester_id, 
+                    requester_name, file_path, is_video, position
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                chat_id, track_data['title'], track_data['url'],
+                track_data['duration'], track_data['requester_id'],
+                track_data['requester_name'], track_data.get('file_path'),
+                track_data.get('is_video', False), position
+            ))
+        elif kind == 'remove' and op[2] is None:
+            # Remove first track
+            await db.execute("""
+                DELETE FROM queue WHERE chat_id = ? AND position = (
+                    SELECT MIN(position) FROM queue WHERE chat_id = ?
+                )
+            """, (chat_id, chat_id))
+        elif kind == 'remove':
+            await db.execute("""
+                DELETE FROM queue WHERE chat_id = ? AND position = ?
+            """, (chat_id, op[2]))
+        elif kind == 'clear':
+            await db.execute("DELETE FROM queue WHERE chat_id = ?", (chat_id,))
+    
+    async def close(self):
+        """Flush everything and stop the background flusher"""
+        if self.flush_task and not self.flush_task.done():
+            # Let a flush that is already writing finish before stopping the loop
+            async with self.lock:
+                self.flush_task.cancel()
+        await self.flush()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get journal statistics"""
+        return {
+            'pending': len(self.pending),
+            'flushes': self.flushes,
+            'flushed_ops': self.flushed_ops,
+            'avg_batch': round(self.flushed_ops / self.flushes, 1) if self.flushes else 0.0,
+            'last_flush_ms': self.last_flush_ms
+        }
+
 class Database:
     """Database manager for the music bot"""
     
-    def __init__(self, db_path: str = "music_bot.db"):
+    def __init__(self, db_path: str = "music_bot.db", queue_flush_interval: float = 0.5,
+                 queue_flush_size: int = 200):
         self.db_path = db_path
         self.lock = asyncio.Lock()
+        self.journal = QueueJournal(db_path, queue_flush_interval, queue_flush_size)
     
     async def init_db(self):
         """Initialize database with required tables"""
         async with aiosqlite.connect(self.db_path) as db:
+            # WAL lets batched queue writes commit without blocking readers
+            await db.execute("PRAGMA journal_mode=WAL")
+            
             # Users table
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS users (
@@ -85,6 +224,60 @@ class Database:
                 )
             """)
             
+            # Search cache table (sidecar for the in-memory search cache)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS search_cache (
+                    mode TEXT,
+                    query_key TEXT,
+                    data_json TEXT,
+                    expires_at REAL,
+                    PRIMARY KEY (mode, query_key)
+                )
+            """)
+            
+            # Player sessions table (chats to resume after a restart)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS player_sessions (
+                    chat_id INTEGER PRIMARY KEY,
+                    assistant TEXT,
+                    position REAL DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
+            # Spotify track to YouTube video matches
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS spotify_map (
+                    spotify_id TEXT PRIMARY KEY,
+                    video_id TEXT,
+                    title TEXT,
+                    duration INTEGER,
+                    matched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
+            # Fuzzy index of played tracks
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS track_index (
+                    webpage_url TEXT PRIMARY KEY,
+                    title TEXT,
+                    uploader TEXT,
+                    duration INTEGER,
+                    thumbnail TEXT,
+                    trigram_count INTEGER,
+                    plays INTEGER DEFAULT 1,
+                    last_played TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS track_trigrams (
+                    trigram TEXT,
+                    webpage_url TEXT,
+                    PRIMARY KEY (trigram, webpage_url)
+                ) WITHOUT ROWID
+            """)
+            
             # Activity logs table
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS activity_logs (
@@ -314,29 +507,13 @@ class Database:
     # Queue management
     async def add_to_queue(self, chat_id: int, track_data: Dict[str, Any]):
         """Add track to queue"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Get next position
-            cursor = await db.execute("""
-                SELECT COALESCE(MAX(position), 0) + 1 FROM queue WHERE chat_id = ?
-            """, (chat_id,))
-            position = (await cursor.fetchone())[0]
-            
-            await db.execute("""
-                INSERT INTO queue (
-                    chat_id, title, url, duration, requester_id, 
-                    requester_name, file_path, is_video, position
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                chat_id, track_data['title'], track_data['url'],
-                track_data['duration'], track_data['requester_id'],
-                track_data['requester_name'], track_data.get('file_path'),
-                track_data.get('is_video', False), position
-            ))
-            await db.commit()
-            return position
+        position = await self.journal.next_position(chat_id)
+        self.journal.append(('add', chat_id, position, track_data))
+        return position
     
     async def get_queue(self, chat_id: int) -> List[Dict[str, Any]]:
         """Get queue for a chat"""
+        await self.journal.flush()
         async with aiosqlite.connect(self.db_path) as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("""
@@ -347,49 +524,34 @@ class Database:
     
     async def remove_from_queue(self, chat_id: int, position: int = None):
         """Remove track from queue"""
-        async with aiosqlite.connect(self.db_path) as db:
-            if position is None:
-                # Remove first track
-                await db.execute("""
-                    DELETE FROM queue WHERE chat_id = ? AND position = (
-                        SELECT MIN(position) FROM queue WHERE chat_id = ?
-                    )
-                """, (chat_id, chat_id))
-            else:
-                await db.execute("""
-                    DELETE FROM queue WHERE chat_id = ? AND position = ?
-                """, (chat_id, position))
-            await db.commit()
+        self.journal.append(('remove', chat_id, position))
     
     async def clear_queue(self, chat_id: int):
         """Clear entire queue for a chat"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("DELETE FROM queue WHERE chat_id = ?", (chat_id,))
-            await db.commit()
+        self.journal.append(('clear', chat_id))
     
-    async def shuffle_queue(self, chat_id: int):
-        """Shuffle queue for a chat"""
-        import random
+    async def shuffle_queue(self, chat_id: int, order: List[int]):
+        """Reorder a chat's queue behind its first track
+        
+        order lists the current queue indexes of the tracks after the first,
+        in their new order, as the player shuffled them in memory.
+        """
+        await self.journal.flush()
         async with aiosqlite.connect(self.db_path) as db:
-            # Get all tracks except the first one (currently playing)
             cursor = await db.execute("""
-                SELECT id FROM queue WHERE chat_id = ? AND position > (
-                    SELECT MIN(position) FROM queue WHERE chat_id = ?
-                ) ORDER BY position
-            """, (chat_id, chat_id))
-            track_ids = [row[0] for row in await cursor.fetchall()]
+                SELECT id, position FROM queue WHERE chat_id = ? ORDER BY position
+            """, (chat_id,))
+            rows = await cursor.fetchall()
             
-            if len(track_ids) < 2:
+            if len(rows) != len(order) + 1 or sorted(order) != list(range(1, len(rows))):
+                logger.error(f"Queue for {chat_id} does not match the shuffled order, not reordering")
                 return False
             
-            # Shuffle the IDs
-            random.shuffle(track_ids)
-            
-            # Update positions
-            for i, track_id in enumerate(track_ids, 2):  # Start from position 2
-                await db.execute("""
-                    UPDATE queue SET position = ? WHERE id = ?
-                """, (i, track_id))
+            # Reuse the existing positions so the head stays first
+            positions = [row[1] for row in rows[1:]]
+            await db.executemany("""
+                UPDATE queue SET position = ? WHERE id = ?
+            """, [(position, rows[index][0]) for position, index in zip(positions, order)])
             
             await db.commit()
             return True
@@ -434,7 +596,10 @@ class Database:
             }
             
             standard_settings = {k: v for k, v in settings.items() if k in standard_fields}
-            extra_settings = {k: v for k, v in settings.items() if k not in standard_fields}
+            extra_settings = {
+                k: v for k, v in settings.items()
+                if k not in standard_fields and k not in ('chat_id', 'settings_json')
+            }
             
             # Build update query for standard fields
             if standard_settings:
@@ -454,6 +619,126 @@ class Database:
             
             await db.commit()
     
+    # Search cache persistence
+    async def save_search_cache(self, mode: str, query_key: str, data: Dict[str, Any], expires_at: float):
+        """Persist a cached search result"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("""
+                INSERT OR REPLACE INTO search_cache (mode, query_key, data_json, expires_at)
+                VALUES (?, ?, ?, ?)
+            """, (mode, query_key, json.dumps(data), expires_at))
+            await db.commit()
+    
+    async def load_search_cache(self, limit: int) -> List[tuple]:
+        """Load unexpired cached search results, oldest first"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute("""
+                SELECT mode, query_key, data_json, expires_at FROM (
+                    SELECT * FROM search_cache WHERE expires_at > ?
+                    ORDER BY expires_at DESC LIMIT ?
+                ) ORDER BY expires_at
+            """, (datetime.now().timestamp(), limit))
+            rows = await cursor.fetchall()
+            return [(row[0], row[1], json.loads(row[2]), row[3]) for row in rows]
+    
+    async def cleanup_search_cache(self):
+        """Remove expired cached search results"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("""
+                DELETE FROM search_cache WHERE expires_at <= ?
+            """, (datetime.now().timestamp(),))
+            await db.commit()
+    
+    # Player sessions
+    async def save_player_sessions(self, sessions: List[Tuple[int, str, float]]):
+        """Record chats that are playing, as (chat_id, assistant, position) rows"""
+        if not sessions:
+            return
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.executemany("""
+                INSERT OR REPLACE INTO player_sessions (chat_id, assistant, position, updated_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            """, sessions)
+            await db.commit()
+    
+    async def get_player_sessions(self) -> List[Dict[str, Any]]:
+        """Get chats that were playing when the bot last stopped"""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute("""
+                SELECT * FROM player_sessions ORDER BY updated_at DESC
+            """)
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+    
+    async def remove_player_session(self, chat_id: int):
+        """Forget a chat's session once it stops playing"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("DELETE FROM player_sessions WHERE chat_id = ?", (chat_id,))
+            await db.commit()
+    
+    # Spotify matches
+    async def get_spotify_matches(self, spotify_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get stored YouTube matches for Spotify track IDs"""
+        matches = {}
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            # Stay well under SQLite's bound parameter limit
+            for start in range(0, len(spotify_ids), 500):
+                chunk = spotify_ids[start:start + 500]
+                cursor = await db.execute(f"""
+                    SELECT * FROM spotify_map WHERE spotify_id IN ({', '.join('?' * len(chunk))})
+                """, chunk)
+                for row in await cursor.fetchall():
+                    matches[row['spotify_id']] = dict(row)
+        return matches
+    
+    async def save_spotify_matches(self, matches: List[Tuple[str, str, str, int]]):
+        """Store (spotify_id, video_id, title, duration) matches"""
+        if not matches:
+            return
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.executemany("""
+                INSERT OR REPLACE INTO spotify_map (spotify_id, video_id, title, duration)
+                VALUES (?, ?, ?, ?)
+            """, matches)
+            await db.commit()
+    
+    # Track index
+    async def index_track(self, track: Dict[str, Any], trigrams: Iterable[str]):
+        """Add a played track and its trigrams to the index, or count another play"""
+        trigrams = list(trigrams)
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute("""
+                UPDATE track_index SET plays = plays + 1, last_played = CURRENT_TIMESTAMP
+                WHERE webpage_url = ?
+            """, (track['webpage_url'],))
+            if cursor.rowcount == 0:
+                await db.execute("""
+                    INSERT INTO track_index (webpage_url, title, uploader, duration, thumbnail, trigram_count)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (track['webpage_url'], track['title'], track.get('uploader'),
+                      track.get('duration'), track.get('thumbnail'), len(trigrams)))
+                await db.executemany("""
+                    INSERT OR IGNORE INTO track_trigrams (trigram, webpage_url) VALUES (?, ?)
+                """, [(trigram, track['webpage_url']) for trigram in trigrams])
+            await db.commit()
+    
+    async def search_track_index(self, trigrams: List[str], limit: int) -> List[Dict[str, Any]]:
+        """Get the indexed tracks sharing the most trigrams with a query"""
+        trigrams = trigrams[:500]
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute(f"""
+                SELECT t.*, COUNT(*) AS shared
+                FROM track_trigrams g JOIN track_index t ON t.webpage_url = g.webpage_url
+                WHERE g.trigram IN ({', '.join('?' * len(trigrams))})
+                GROUP BY g.webpage_url
+                ORDER BY shared DESC, t.plays DESC
+                LIMIT ?
+            """, (*trigrams, limit))
+            return [dict(row) for row in await cursor.fetchall()]
+    
     # Activity logging
     async def log_activity(self, user_id: int, chat_id: int, command: str, 
                           success: bool = True, error_message: str = None):
@@ -526,6 +811,7 @@ class Database:
     
     async def cleanup_empty_queues(self):
         """Clean up empty queue entries"""
+        await self.journal.flush()
         async with aiosqlite.connect(self.db_path) as db:
             await db.execute("""
                 DELETE FROM queue 
@@ -542,14 +828,22 @@ class Database:
     async def backup_database(self, backup_path: str):
         """Create database backup"""
         import shutil
+        await self.journal.flush()
         async with self.lock:
+            # Fold the WAL into the main file so the copy is complete
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
             shutil.copy2(self.db_path, backup_path)
     
     async def close(self):
         """Close database connections"""
+        # Persist buffered queue writes before anything else
+        await self.journal.close()
+        
         # Perform final cleanup
         await self.cleanup_old_logs()
         await self.cleanup_empty_queues()
+        await self.cleanup_search_cache()
         logger.info("Database connections closed")
 
 # Initialize database instance
@@ -571,4 +865,32 @@ if __name__ == "__main__":
         total_chats = await db.get_total_chats()
         print(f"Total chats: {total_chats}")
     
+    # Closing the journal while a flush is writing must not lose the batch
+    async def test_close_during_flush():
+        import os
+        import tempfile
+        test_db = Database(os.path.join(tempfile.mkdtemp(), "journal.db"))
+        await test_db.init_db()
+        journal = test_db.journal
+        for i in range(50):
+            await test_db.add_to_queue(1, {
+                'title': f"Track {i}", 'url': None, 'duration': 0,
+                'requester_id': 1, 'requester_name': "Test"
+            })
+        
+        # Slow every write down so close() lands in the middle of a flush
+        apply = journal._apply
+        async def slow_apply(conn, op):
+            await asyncio.sleep(0.01)
+            await apply(conn, op)
+        journal._apply = slow_apply
+        journal.wakeup.set()
+        await asyncio.sleep(0.05)
+        await journal.close()
+        
+        rows = await test_db.get_queue(1)
+        print(f"Close during flush: {len(rows)} rows persisted, {len(journal.pending)} pending")
+        assert len(rows) == 50 and not journal.pending
+    
     asyncio.run(test_db())
+    asyncio.run(test_close_during_flush())
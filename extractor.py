@@ -0,0 +1,704 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import bisect
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Iterator, List, Optional, Set, Tuple
+import yt_dlp
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, lower runs first
+PRIORITY_INTERACTIVE = 0  # a user is waiting, e.g. /play
+PRIORITY_PREFETCH = 1  # preparing the next tracks in a queue
+PRIORITY_BULK = 2  # imports and playlists
+PRIORITY_NAMES = ('interactive', 'prefetch', 'bulk')
+
+# Upper bounds in seconds of the queue wait histogram buckets
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Priority, chat and user that extractions started in the current task run for
+_context: ContextVar[Tuple[int, Optional[int], Optional[int]]] = ContextVar(
+    'extraction_context', default=(PRIORITY_INTERACTIVE, None, None)
+)
+
+# Set in SingleFlight tasks to their flight, whose jobs serve callers from several chats
+_shared: ContextVar[Optional["_Flight"]] = ContextVar('shared_extraction', default=None)
+
+@contextmanager
+def extraction_context(priority: int, chat_id: Optional[int] = None,
+                       user_id: Optional[int] = None) -> Iterator[None]:
+    """Run extractions inside the block, and tasks started there, at a priority for a chat and user"""
+    token = _context.set((priority, chat_id, user_id))
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+class JobCancelled(Exception):
+    """Raised to the caller of a job that was cancelled before it finished"""
+
+class SourceUnavailable(Exception):
+    """Raised without running a job while its source's circuit breaker is open"""
+
+class CircuitBreaker:
+    """Stops sending work to a source that keeps failing or stalling, then probes it
+    
+    Closed, calls flow and their outcomes are kept for a rolling window;
+    once enough of them fail (errors, timeouts or calls slower than
+    slow_call) the breaker opens and calls fail fast. After open_for it
+    goes half-open and lets a few trial calls through: if they all
+    succeed it closes, if one fails it opens again for twice as long.
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, name: str, window: float = Config.BREAKER_WINDOW,
+                 min_calls: int = Config.BREAKER_MIN_CALLS,
+                 error_rate: float = Config.BREAKER_ERROR_RATE,
+                 slow_call: float = Config.BREAKER_SLOW_CALL,
+                 open_for: float = Config.BREAKER_OPEN_SECONDS,
+                 max_open_for: float = Config.BREAKER_MAX_OPEN_SECONDS,
+                 probes: int = Config.BREAKER_PROBES):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.base_open_for = open_for
+        self.max_open_for = max_open_for
+        self.probes = probes
+        
+        self.state = self.CLOSED
+        self.calls: Deque[Tuple[float, bool, float]] = deque()
+        self.open_for = open_for
+        self.open_until = 0.0
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        
+        self.trips = 0
+        self.rejected = 0
+    
+    def allow(self) -> bool:
+        """Whether a call may go to the source now"""
+        if self.state == self.OPEN:
+            if time.monotonic() < self.open_until:
+                self.rejected += 1
+                return False
+            self.state = self.HALF_OPEN
+            self.probes_in_flight = 0
+            self.probe_successes = 0
+            logger.info(f"Circuit for {self.name} half-open, probing")
+        
+        if self.state == self.HALF_OPEN:
+            if self.probes_in_flight + self.probe_successes >= self.probes:
+                self.rejected += 1
+                return False
+            self.probes_in_flight += 1
+        return True
+    
+    def record(self, ok: bool, latency: float):
+        """Record the outcome of an allowed call"""
+        failed = not ok or latency >= self.slow_call
+        
+        if self.state == self.HALF_OPEN:
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+            if failed:
+                self._trip(min(self.open_for * 2, self.max_open_for))
+            else:
+                self.probe_successes += 1
+                if self.probe_successes >= self.probes:
+                    self._close()
+            return
+        
+        if self.state == self.OPEN:
+            # Started before the breaker opened, the verdict is already in
+            return
+        
+        now = time.monotonic()
+        self.calls.append((now, failed, latency))
+        while self.calls and self.calls[0][0] < now - self.window:
+            self.calls.popleft()
+        
+        failures = sum(1 for _, call_failed, _ in self.calls if call_failed)
+        if len(self.calls) >= self.min_calls and failures / len(self.calls) >= self.error_rate:
+            self._trip(self.base_open_for)
+    
+    def release(self):
+        """Forget an allowed call that ended without a verdict, e.g. cancelled"""
+        if self.state == self.HALF_OPEN:
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+    
+    def retry_in(self) -> float:
+        """Seconds until the source is probed again"""
+        return max(0.0, self.open_until - time.monotonic()) if self.state == self.OPEN else 0.0
+    
+    def _trip(self, open_for: float):
+        """Open the breaker for open_for seconds"""
+        self.state = self.OPEN
+        self.open_for = open_for
+        self.open_until = time.monotonic() + open_for
+        self.calls.clear()
+        self.trips += 1
+        logger.warning(f"Circuit for {self.name} opened for {open_for:.0f}s")
+    
+    def _close(self):
+        """Trust the source again"""
+        self.state = self.CLOSED
+        self.open_for = self.base_open_for
+        self.calls.clear()
+        logger.info(f"Circuit for {self.name} closed")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get breaker state and counters"""
+        failures = sum(1 for _, failed, _ in self.calls if failed)
+        latencies = sorted(latency for _, _, latency in self.calls)
+        return {
+            'state': self.state,
+            'retry_in': round(self.retry_in(), 1),
+            'error_rate': round(failures / len(self.calls) * 100, 1) if self.calls else 0.0,
+            'p50_ms': round(latencies[len(latencies) // 2] * 1000) if latencies else None,
+            'trips': self.trips,
+            'rejected': self.rejected
+        }
+
+class _Job:
+    """One scheduled extraction or download"""
+    
+    __slots__ = ('source', 'chat_id', 'priority', 'flight', 'task', 'waiting', 'cancelled', 'abandoned',
+                 'started_at')
+    
+    def __init__(self, source: str, chat_id: Optional[int], priority: int,
+                 flight: Optional["_Flight"] = None):
+        self.source = source
+        self.chat_id = chat_id
+        self.priority = priority
+        self.flight = flight  # cancelled by SingleFlight once no chat waits on it, not by cancel_chat
+        self.task: Optional[asyncio.Task] = None
+        self.waiting: Optional[Tuple[Hashable, asyncio.Future]] = None  # user and future while queued
+        self.started_at: Optional[float] = None
+        # Checked from the worker thread, so it must be thread-safe
+        self.cancelled = threading.Event()
+        self.abandoned = False
+
+# The job the current worker thread is running, for progress hooks
+_current = threading.local()
+
+def cancel_hook(status: Dict[str, Any]):
+    """yt-dlp progress hook that aborts a download once its job is cancelled"""
+    job = getattr(_current, 'job', None)
+    if job is not None and job.cancelled.is_set():
+        raise yt_dlp.utils.DownloadCancelled()
+
+class _FairSlots:
+    """Slots of one source, handed out by priority class, then round-robin across chats and users"""
+    
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_use = 0
+        # Per class: chat -> user -> waiting futures, in turn order
+        self.waiting: List["OrderedDict[Hashable, OrderedDict[Hashable, Deque[asyncio.Future]]]"] = [
+            OrderedDict() for _ in PRIORITY_NAMES
+        ]
+    
+    async def acquire(self, job: _Job, user_id: Hashable):
+        """Wait for a slot"""
+        if self.in_use < self.limit and not any(self.waiting):
+            self.in_use += 1
+            return
+        
+        future = asyncio.get_running_loop().create_future()
+        self._queue(job.priority, job.chat_id, user_id, future)
+        job.waiting = (user_id, future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as the waiter gave up, pass the slot on
+                self.release()
+            else:
+                self._discard(job.priority, job.chat_id, user_id, future)
+            raise
+        finally:
+            job.waiting = None
+    
+    def promote(self, job: _Job, priority: int):
+        """Move a queued job to a more urgent class, keeping its turn within the class"""
+        if priority >= job.priority:
+            return
+        if job.waiting is not None:
+            user_id, future = job.waiting
+            if not self._discard(job.priority, job.chat_id, user_id, future):
+                return
+            self._queue(priority, job.chat_id, user_id, future)
+        job.priority = priority
+    
+    def _queue(self, priority: int, chat_id: Hashable, user_id: Hashable, future: asyncio.Future):
+        """Add a waiter behind its chat's and user's earlier ones"""
+        self.waiting[priority].setdefault(chat_id, OrderedDict()).setdefault(user_id, deque()).append(future)
+    
+    def release(self):
+        """Hand a slot to the next waiter in turn, or free it"""
+        future = self._next_waiter()
+        if future is None:
+            self.in_use -= 1
+        else:
+            # The slot moves straight to the waiter
+            future.set_result(None)
+    
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        """Take the next waiter from the most urgent class, rotating chats and their users"""
+        for chats in self.waiting:
+            while chats:
+                chat_id, users = next(iter(chats.items()))
+                user_id, futures = next(iter(users.items()))
+                future = futures.popleft()
+                
+                if futures:
+                    users.move_to_end(user_id)
+                else:
+                    del users[user_id]
+                if users:
+                    chats.move_to_end(chat_id)
+                else:
+                    del chats[chat_id]
+                
+                if not future.done():
+                    return future
+        return None
+    
+    def _discard(self, priority: int, chat_id: Hashable, user_id: Hashable, future: asyncio.Future) -> bool:
+        """Forget a waiter that gave up, returning whether it was still queued"""
+        users = self.waiting[priority].get(chat_id)
+        futures = users.get(user_id) if users else None
+        if futures is None:
+            return False
+        try:
+            futures.remove(future)
+        except ValueError:
+            return False
+        if not futures:
+            del users[user_id]
+        if not users:
+            del self.waiting[priority][chat_id]
+        return True
+    
+    def waiting_count(self, priority: int) -> int:
+        """Count waiters in a class"""
+        return sum(len(futures) for users in self.waiting[priority].values() for futures in users.values())
+
+class ExtractionEngine:
+    """Schedules blocking yt-dlp calls off the event loop with deadlines and per-source limits
+    
+    Each job runs in its own worker thread once its source has a free slot.
+    Free slots go to the most urgent priority class first, and within a
+    class to chats and then users in turn, so a bulk import cannot starve
+    /play elsewhere. A job's deadline starts once it has a slot, the wait
+    for one has its own budget. When a job times out or is cancelled the
+    caller is released and the slot freed at once; the thread is abandoned,
+    and downloads using cancel_hook stop at their next progress update.
+    Each source has a circuit breaker, so a failing source is not waited on.
+    """
+    
+    def __init__(self, limits: Dict[str, int] = Config.EXTRACT_LIMITS,
+                 timeout: float = Config.EXTRACT_TIMEOUT,
+                 queue_timeout: float = Config.EXTRACT_QUEUE_TIMEOUT):
+        self.limits = {source: max(1, limit) for source, limit in limits.items()}
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.slots: Dict[str, _FairSlots] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.jobs: Dict[Optional[int], Set[_Job]] = {}
+        self.waits: Dict[int, Set[asyncio.Future]] = {}  # chats waiting on shared work
+        self._lock = threading.Lock()
+        self._closed = False
+        
+        # Scheduler counters
+        self.queued = 0
+        self.running = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.cancelled = 0
+        self.abandoned_threads = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        
+        # Queue wait histogram per priority class: bucket counts, sum, count
+        self.wait_buckets = [[0] * (len(WAIT_BUCKETS) + 1) for _ in PRIORITY_NAMES]
+        self.wait_sums = [0.0] * len(PRIORITY_NAMES)
+    
+    def _slots(self, source: str) -> _FairSlots:
+        """Get the slots of a source"""
+        if source not in self.slots:
+            limit = self.limits.get(source, self.limits.get('default', Config.MAX_CONCURRENT_DOWNLOADS))
+            self.slots[source] = _FairSlots(limit)
+        return self.slots[source]
+    
+    def breaker(self, source: str) -> CircuitBreaker:
+        """Get the circuit breaker of a source"""
+        if source not in self.breakers:
+            self.breakers[source] = CircuitBreaker(source)
+        return self.breakers[source]
+    
+    def available(self, source: str) -> bool:
+        """Whether a source's breaker is not open"""
+        return source not in self.breakers or self.breakers[source].state != CircuitBreaker.OPEN
+    
+    async def run(self, func: Callable[..., Any], *args, source: str = 'youtube',
+                  chat_id: Optional[int] = None, timeout: Optional[float] = None,
+                  priority: Optional[int] = None) -> Any:
+        """Run a blocking function under its source's limit and await its result
+        
+        Priority and chat default to the surrounding extraction_context;
+        shared work runs at the priority of its most urgent caller.
+        Raises asyncio.TimeoutError past the deadline or when no slot frees
+        up within queue_timeout, JobCancelled when
+        the job is cancelled with cancel_chat and SourceUnavailable at once
+        while the source's circuit breaker is open.
+        """
+        if self._closed:
+            raise RuntimeError("Extraction engine is shut down")
+        
+        breaker = self.breaker(source)
+        if not breaker.allow():
+            raise SourceUnavailable(f"{source} is failing, retrying in {breaker.retry_in():.0f}s")
+        
+        context_priority, context_chat, user_id = _context.get()
+        if priority is None:
+            priority = context_priority
+        if chat_id is None:
+            chat_id = context_chat
+        
+        flight = _shared.get()
+        if flight is not None:
+            priority = min(priority, flight.urgency())
+        
+        job = _Job(source, chat_id, priority, flight)
+        job.task = asyncio.create_task(self._execute(job, func, args, user_id, timeout or self.timeout))
+        self.jobs.setdefault(chat_id, set()).add(job)
+        
+        def ran_for() -> float:
+            # Long jobs such as downloads pass their own timeout and are judged on errors only
+            if timeout or not job.started_at:
+                return 0.0
+            return time.monotonic() - job.started_at
+        
+        try:
+            result = await job.task
+        except asyncio.TimeoutError:
+            job.cancelled.set()
+            self.timed_out += 1
+            if job.started_at:
+                breaker.record(False, ran_for())
+                logger.warning(f"Extraction job for {source} timed out after {timeout or self.timeout}s")
+            else:
+                # Never got a slot, not the source's fault
+                breaker.release()
+                logger.warning(f"Extraction job for {source} got no slot within {self.queue_timeout}s")
+            raise
+        except asyncio.CancelledError:
+            breaker.release()
+            if job.cancelled.is_set():
+                # cancel_chat stopped the job, not whoever was waiting on it
+                raise JobCancelled(f"Extraction job for chat {chat_id} was cancelled")
+            job.cancelled.set()
+            raise
+        except Exception:
+            breaker.record(False, ran_for())
+            raise
+        else:
+            breaker.record(True, ran_for())
+            return result
+        finally:
+            chat_jobs = self.jobs.get(chat_id)
+            if chat_jobs is not None:
+                chat_jobs.discard(job)
+                if not chat_jobs:
+                    del self.jobs[chat_id]
+    
+    async def _execute(self, job: _Job, func: Callable[..., Any], args: tuple,
+                       user_id: Optional[int], timeout: float) -> Any:
+        """Wait for a slot, then run the job in a worker thread until its deadline"""
+        loop = asyncio.get_running_loop()
+        submitted = time.monotonic()
+        with self._lock:
+            self.queued += 1
+        
+        try:
+            await asyncio.wait_for(self._slots(job.source).acquire(job, user_id), self.queue_timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            # Cancelled or gave up while still waiting for a slot
+            with self._lock:
+                self.queued -= 1
+            raise
+        
+        job.started_at = time.monotonic()
+        waited = job.started_at - submitted
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.started += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            self.wait_buckets[job.priority][bisect.bisect_left(WAIT_BUCKETS, waited)] += 1
+            self.wait_sums[job.priority] += waited
+        
+        try:
+            future = loop.create_future()
+            threading.Thread(
+                target=self._work,
+                args=(job, func, args, loop, future),
+                name=f"extractor-{job.source}",
+                daemon=True
+            ).start()
+            
+            try:
+                result = await asyncio.wait_for(future, timeout)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                # Releasing below frees the slot, the thread finishes on its own
+                job.abandoned = True
+                with self._lock:
+                    self.abandoned_threads += 1
+                raise
+            except Exception:
+                with self._lock:
+                    self.failed += 1
+                raise
+            
+            with self._lock:
+                self.completed += 1
+            return result
+        finally:
+            with self._lock:
+                self.running -= 1
+            self._slots(job.source).release()
+    
+    def _work(self, job: _Job, func: Callable[..., Any], args: tuple,
+              loop: asyncio.AbstractEventLoop, future: asyncio.Future):
+        """Worker thread body, hands the outcome back to the event loop"""
+        _current.job = job
+        try:
+            result, error = func(*args), None
+        except BaseException as e:
+            result, error = None, e
+        finally:
+            _current.job = None
+        
+        def settle():
+            if future.done():
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        
+        try:
+            loop.call_soon_threadsafe(settle)
+        except RuntimeError:
+            # The event loop is gone, nobody is waiting any more
+            pass
+    
+    async def wait(self, task: asyncio.Task, chat_id: Optional[int]) -> Any:
+        """Await shared work for a chat, until it finishes or cancel_chat stops the chat waiting"""
+        if chat_id is None:
+            return await asyncio.shield(task)
+        
+        stopped = asyncio.get_running_loop().create_future()
+        self.waits.setdefault(chat_id, set()).add(stopped)
+        try:
+            # Like shield, leaving the wait does not cancel the task
+            await asyncio.wait((task, stopped), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            chat_waits = self.waits.get(chat_id)
+            if chat_waits is not None:
+                chat_waits.discard(stopped)
+                if not chat_waits:
+                    del self.waits[chat_id]
+        
+        if not task.done():
+            raise JobCancelled(f"Extraction wait for chat {chat_id} was cancelled")
+        return task.result()
+    
+    def promote(self, flight: "_Flight"):
+        """Move jobs run for a flight, or for flights nested in it, up to their callers' priority"""
+        for chat_jobs in self.jobs.values():
+            for job in chat_jobs:
+                if job.flight is not None and job.flight.runs_for(flight):
+                    self._slots(job.source).promote(job, job.flight.urgency())
+    
+    def cancel_chat(self, chat_id: int) -> int:
+        """Cancel a chat's own jobs and its waits on shared ones
+        
+        Shared jobs keep running for other chats; SingleFlight cancels them
+        once nobody waits any more.
+        """
+        jobs = [job for job in self.jobs.get(chat_id, ()) if not job.flight and not job.cancelled.is_set()]
+        for job in jobs:
+            job.cancelled.set()
+            if job.task and not job.task.done():
+                job.task.cancel()
+        waits = [waiter for waiter in self.waits.pop(chat_id, ()) if not waiter.done()]
+        for waiter in waits:
+            waiter.set_result(None)
+        
+        self.cancelled += len(jobs) + len(waits)
+        if jobs or waits:
+            logger.info(f"Cancelled {len(jobs)} extraction job(s) and {len(waits)} wait(s) for {chat_id}")
+        return len(jobs) + len(waits)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get scheduler statistics"""
+        with self._lock:
+            avg_wait = self.total_wait / self.started if self.started else 0.0
+            return {
+                'workers': sum(limit for source, limit in self.limits.items() if source != 'default'),
+                'limits': dict(self.limits),
+                'running': self.running,
+                'queued': self.queued,
+                'completed': self.completed,
+                'failed': self.failed,
+                'timed_out': self.timed_out,
+                'cancelled': self.cancelled,
+                'abandoned_threads': self.abandoned_threads,
+                'avg_wait_ms': round(avg_wait * 1000, 1),
+                'max_wait_ms': round(self.max_wait * 1000, 1),
+                'queued_by_class': {
+                    name: sum(slots.waiting_count(priority) for slots in self.slots.values())
+                    for priority, name in enumerate(PRIORITY_NAMES)
+                },
+                'wait_histograms': {
+                    name: self._histogram(priority) for priority, name in enumerate(PRIORITY_NAMES)
+                },
+                'breakers': {source: breaker.get_stats() for source, breaker in self.breakers.items()}
+            }
+    
+    def _histogram(self, priority: int) -> Dict[str, Any]:
+        """Get a class's queue wait histogram with cumulative bucket counts"""
+        buckets = {}
+        total = 0
+        for bound, count in zip(list(WAIT_BUCKETS) + ['+Inf'], self.wait_buckets[priority]):
+            total += count
+            buckets[str(bound)] = total
+        return {'buckets': buckets, 'sum': round(self.wait_sums[priority], 3), 'count': total}
+    
+    def shutdown(self):
+        """Stop accepting jobs and cancel the ones still waiting"""
+        self._closed = True
+        for chat_id in list(self.jobs):
+            for job in list(self.jobs.get(chat_id, ())):
+                job.cancelled.set()
+                if job.task and not job.task.done():
+                    job.task.cancel()
+        logger.info("Extraction engine stopped")
+
+class _Flight:
+    """One in-flight call shared by every caller with the same key"""
+    
+    __slots__ = ('task', 'waiters', 'priority', 'parent')
+    
+    def __init__(self, priority: int, parent: Optional["_Flight"] = None):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        self.priority = priority  # of the most urgent caller so far
+        self.parent = parent  # the shared work that started this flight, if any
+    
+    def urgency(self) -> int:
+        """Most urgent priority among this flight's callers and those of the flights it runs for"""
+        flight, priority = self, self.priority
+        while flight is not None:
+            priority = min(priority, flight.priority)
+            flight = flight.parent
+        return priority
+    
+    def runs_for(self, other: "_Flight") -> bool:
+        """Whether this flight is other or nested in it"""
+        flight = self
+        while flight is not None:
+            if flight is other:
+                return True
+            flight = flight.parent
+        return False
+
+class SingleFlight:
+    """Coalesces concurrent identical calls into a single shared execution"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.flights: Dict[Hashable, _Flight] = {}
+        self.executed = 0
+        self.coalesced = 0
+    
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]], chat_id: Optional[int] = None) -> Any:
+        """Run func() once for all concurrent callers using the same key
+        
+        The caller waits for chat_id, or the chat of its extraction_context,
+        so cancel_chat only stops that chat's wait. The shared work is
+        cancelled once every caller has gone, and runs at the priority of
+        the most urgent caller.
+        """
+        parent = _shared.get()
+        if parent is not None:
+            # Nested in shared work, which is cancelled as a whole
+            chat_id = None
+        elif chat_id is None:
+            chat_id = _context.get()[1]
+        priority = _context.get()[0]
+        
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = _Flight(priority, parent)
+            flight.task = asyncio.create_task(self._run_shared(func, flight))
+            self.flights[key] = flight
+            self.executed += 1
+            flight.task.add_done_callback(lambda _, k=key, f=flight: self._forget(k, f))
+        else:
+            self.coalesced += 1
+            if priority < flight.priority:
+                # An interactive caller must not queue behind the prefetch or import that started the work
+                flight.priority = priority
+                extractor.promote(flight)
+        
+        flight.waiters += 1
+        try:
+            # One caller going away does not cancel the shared work
+            return await extractor.wait(flight.task, chat_id)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Nobody is interested any more, abandon the work
+                self._forget(key, flight)
+                flight.task.cancel()
+    
+    @staticmethod
+    async def _run_shared(func: Callable[[], Awaitable[Any]], flight: _Flight) -> Any:
+        """Run a flight's work with its extraction jobs marked as shared"""
+        # The task has its own copy of the context, so this stays inside it
+        _shared.set(flight)
+        return await func()
+    
+    def _forget(self, key: Hashable, flight: _Flight):
+        """Drop a finished or abandoned flight so later calls start fresh"""
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get coalescing statistics"""
+        return {
+            'in_flight': len(self.flights),
+            'executed': self.executed,
+            'coalesced': self.coalesced
+        }
+
+# Shared extraction engine instance
+extractor = ExtractionEngine()
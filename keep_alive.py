@@ -6,6 +6,7 @@ import logging
 from threading import Thread
 from flask import Flask, jsonify, render_template_string
 from config import Config
+from extractor import extractor
 import time
 import psutil
 import os
@@ -421,6 +422,7 @@ def metrics():
     """Metrics endpoint in Prometheus format"""
     try:
         system_stats = keep_alive.get_system_stats()
+        extractor_stats = extractor.get_stats()
         
         metrics_text = f"""# HELP bot_uptime_seconds Bot uptime in seconds
 # TYPE bot_uptime_seconds counter
@@ -437,6 +439,55 @@ system_memory_percent {system_stats['memory_percent']}
 # HELP system_disk_percent Disk usage percentage
 # TYPE system_disk_percent gauge
 system_disk_percent {system_stats['disk_percent']}
+
+# HELP extractor_queue_depth Extraction jobs waiting for a worker
+# TYPE extractor_queue_depth gauge
+extractor_queue_depth {extractor_stats['queued']}
+
+# HELP extractor_running_jobs Extraction jobs currently running
+# TYPE extractor_running_jobs gauge
+extractor_running_jobs {extractor_stats['running']}
+
+# HELP extractor_wait_ms_avg Average extraction queue wait in milliseconds
+# TYPE extractor_wait_ms_avg gauge
+extractor_wait_ms_avg {extractor_stats['avg_wait_ms']}
+
+# HELP extractor_wait_ms_max Maximum extraction queue wait in milliseconds
+# TYPE extractor_wait_ms_max gauge
+extractor_wait_ms_max {extractor_stats['max_wait_ms']}
+
+# HELP extractor_jobs_total Finished extraction jobs
+# TYPE extractor_jobs_total counter
+extractor_jobs_total{{result="ok"}} {extractor_stats['completed']}
+extractor_jobs_total{{result="error"}} {extractor_stats['failed']}
+
+# HELP extractor_queue_wait_seconds Time extraction jobs waited for a slot, by priority class
+# TYPE extractor_queue_wait_seconds histogram
+"""
+        for priority_class, histogram in extractor_stats['wait_histograms'].items():
+            for bound, count in histogram['buckets'].items():
+                metrics_text += f'extractor_queue_wait_seconds_bucket{{class="{priority_class}",le="{bound}"}} {count}\n'
+            metrics_text += f'extractor_queue_wait_seconds_sum{{class="{priority_class}"}} {histogram["sum"]}\n'
+            metrics_text += f'extractor_queue_wait_seconds_count{{class="{priority_class}"}} {histogram["count"]}\n'
+        
+        metrics_text += """
+# HELP extractor_breaker_open Whether a source's circuit breaker is open
+# TYPE extractor_breaker_open gauge
+"""
+        for source, breaker in extractor_stats['breakers'].items():
+            metrics_text += f'extractor_breaker_open{{source="{source}"}} {int(breaker["state"] == "open")}\n'
+        
+        if keep_alive.bot_instance and hasattr(keep_alive.bot_instance, 'music_player'):
+            cache_stats = keep_alive.bot_instance.music_player.search_cache.get_stats()
+            metrics_text += f"""
+# HELP search_cache_lookups_total Search cache lookups
+# TYPE search_cache_lookups_total counter
+search_cache_lookups_total{{result="hit"}} {cache_stats['hits']}
+search_cache_lookups_total{{result="miss"}} {cache_stats['misses']}
+
+# HELP search_cache_size Entries in the search cache
+# TYPE search_cache_size gauge
+search_cache_size {cache_stats['size']}
 """
         
         return metrics_text, 200, {'Content-Type': 'text/plain'}
@@ -3,10 +3,12 @@
 
 import asyncio
 import os
+import time
 import logging
-from typing import Dict, List, Optional, Any
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Any
 from pyrogram import Client
 from pyrogram.types import User
+from pyrogram.errors import FloodWait
 from pytgcalls import PyTgCalls
 from pytgcalls.types import AudioPiped, VideoPiped
 from pytgcalls.types.input_stream import AudioParameters, VideoParameters
@@ -15,9 +17,24 @@ from pytgcalls.types.input_stream.quality import HighQualityAudio, HighQualityVi
 from pytgcalls.exceptions import NoActiveGroupCall, NotInGroupCallError
 import yt_dlp
 import json
+from collections import deque
 import random
 from config import Config
 from database import Database
+from extractor import (extractor, SingleFlight, JobCancelled, SourceUnavailable, cancel_hook,
+                       extraction_context, PRIORITY_INTERACTIVE, PRIORITY_BULK)
+from cache import SearchCache, StreamURLCache
+from track_index import TrackIndex
+from sources import SearchSource, HedgedSearch, source_for_url, download_source_for_url
+from ydl_pool import ydl_pool
+from prefetcher import Prefetcher
+from call_manager import CallManager
+from chat_actor import ChatActors
+from playback import PlaybackClock, KeyframeIndex, build_ffmpeg_parameters
+from state import ChatState, Requester, Track
+from spotify import SpotifyClient, youtube_video_id
+from youtube_search import YouTubeSearchClient
+from utils import sanitize_filename, acquire_downloaded_file, release_downloaded_file
 
 logger = logging.getLogger(__name__)
 
@@ -25,282 +42,748 @@ class MusicPlayer:
     """Music player manager for voice calls"""
     
     def __init__(self):
-        self.db = Database()
-        self.active_calls: Dict[int, PyTgCalls] = {}
-        self.queues: Dict[int, List[Dict[str, Any]]] = {}
-        self.current_tracks: Dict[int, Dict[str, Any]] = {}
-        self.loop_status: Dict[int, bool] = {}
-        self.loop_counts: Dict[int, int] = {}
-        self.speeds: Dict[int, float] = {}
-        self.volumes: Dict[int, int] = {}
+        self.db = Database(
+            queue_flush_interval=Config.QUEUE_FLUSH_INTERVAL,
+            queue_flush_size=Config.QUEUE_FLUSH_SIZE
+        )
+        self.calls = CallManager(self.on_track_end, self.cleanup_chat)
+        self.actors = ChatActors(on_start=self._hydrate)
+        self.assistant_pool = None  # set by the bot when assistants are configured
+        self.transition_stats = {'count': 0, 'total_ms': 0.0, 'last_ms': 0.0, 'over_target': 0}
+        self.chats: Dict[int, ChatState] = {}
+        self.play_retries: Dict[int, asyncio.Task] = {}  # chats waiting for a failing source to come back
+        self.generations: Dict[int, int] = {}  # bumped by /stop and cleanup, so running imports give up
+        self.keyframes = KeyframeIndex()
+        self.search_cache = SearchCache(self.db)
+        self.track_index = TrackIndex(self.db)
+        self.stream_cache = StreamURLCache()
+        self.prefetcher = Prefetcher(self)
+        self.spotify = SpotifyClient()
+        self.youtube_search = YouTubeSearchClient()
+        self.youtube_fallbacks = 0
+        
+        # Coalesce concurrent identical extractions
+        self.search_flights = SingleFlight("search")
+        self.resolve_flights = SingleFlight("resolve")
+        self.download_flights = SingleFlight("download")
         
         # YouTube-DL options
         self.ytdl_opts = Config.YTDL_OPTS.copy()
         self.ytdl_video_opts = Config.YTDL_VIDEO_OPTS.copy()
-    
-    async def init_pytgcalls(self, client: Client) -> PyTgCalls:
-        """Initialize PyTgCalls for a client"""
-        pytgcalls = PyTgCalls(client)
         
-        @pytgcalls.on_stream_end()
-        async def on_stream_end(client, update):
-            chat_id = update.chat_id
-            await self.on_track_end(chat_id, client)
+        # Flat extraction only lists entries, formats are resolved at play time
+        self.ytdl_search_opts = Config.YTDL_OPTS.copy()
+        self.ytdl_search_opts['extract_flat'] = 'in_playlist'
+        ydl_pool.warm(self.ytdl_search_opts)
         
-        @pytgcalls.on_closed_voice_chat()
-        async def on_closed_vc(client, update):
-            chat_id = update.chat_id
-            await self.cleanup_chat(chat_id)
-        
-        await pytgcalls.start()
-        return pytgcalls
-    
-    async def get_pytgcalls(self, chat_id: int, client: Client) -> PyTgCalls:
-        """Get or create PyTgCalls instance for chat"""
-        if chat_id not in self.active_calls:
-            self.active_calls[chat_id] = await self.init_pytgcalls(client)
-        return self.active_calls[chat_id]
+        # Search sources, hedged against each other when the primary is slow
+        native = self._search_youtube_native if Config.YOUTUBE_NATIVE_SEARCH else None
+        available = {
+            'youtube': SearchSource('youtube', self._search_youtube_sync, search_async=native),
+            'soundcloud': SearchSource('soundcloud', self._search_soundcloud_sync, supports_video=False)
+        }
+        self.search_sources = HedgedSearch(
+            [available[name] for name in Config.SEARCH_SOURCES if name in available] or [available['youtube']]
+        )
     
     async def search_youtube(self, query: str, video: bool = False) -> Optional[Dict[str, Any]]:
-        """Search YouTube for a track"""
+        """Search for a track, on YouTube first and other sources when it is slow"""
         try:
-            opts = self.ytdl_video_opts if video else self.ytdl_opts
+            cached = await self.search_cache.get(query, video)
+            if cached:
+                return cached
             
-            with yt_dlp.YoutubeDL(opts) as ydl:
-                # Search for the video
-                search_results = ydl.extract_info(
-                    f"ytsearch:{query}",
-                    download=False
-                )
-                
-                if not search_results or not search_results.get('entries'):
-                    return None
-                
-                # Get the first result
-                video_info = search_results['entries'][0]
-                
-                # Get direct URL
-                if 'formats' in video_info:
-                    if video:
-                        # For video, get best video format
-                        format_selector = ydl.build_format_selector('best[height<=720][ext=mp4]/best[ext=mp4]/best')
-                        formats = format_selector({'formats': video_info['formats']})
-                        if formats:
-                            video_info['url'] = formats[0]['url']
-                    else:
-                        # For audio, get best audio format
-                        format_selector = ydl.build_format_selector('bestaudio[ext=m4a]/bestaudio/best')
-                        formats = format_selector({'formats': video_info['formats']})
-                        if formats:
-                            video_info['url'] = formats[0]['url']
-                
-                return {
-                    'title': video_info.get('title', 'Unknown'),
-                    'url': video_info.get('url'),
-                    'webpage_url': video_info.get('webpage_url'),
-                    'duration': video_info.get('duration', 0),
-                    'thumbnail': video_info.get('thumbnail'),
-                    'uploader': video_info.get('uploader', 'Unknown'),
-                    'view_count': video_info.get('view_count', 0),
-                    'is_video': video
-                }
-                
+            # Most queries are variants of songs already played here
+            if Config.TRACK_INDEX_ENABLED and not query.startswith('http'):
+                indexed = await self.track_index.search(query, video)
+                if indexed:
+                    return indexed
+            
+            result = await self.search_flights.do(
+                self.search_cache.make_key(query, video),
+                lambda: self._search_and_cache(query, video)
+            )
+            return dict(result) if result else None
+        except JobCancelled:
+            raise
         except Exception as e:
             logger.error(f"YouTube search error: {e}")
             return None
     
-    async def download_track(self, track_info: Dict[str, Any]) -> Optional[str]:
-        """Download track for local playback"""
+    async def _search_and_cache(self, query: str, video: bool) -> Optional[Dict[str, Any]]:
+        """Run one search extraction and populate the search cache"""
+        result = await self.search_sources.search(query, video)
+        if result:
+            await self.search_cache.put(query, video, result)
+        elif not all(extractor.available(source.name) for source in self.search_sources.sources):
+            # A source is failing, an old answer beats none
+            result = self.search_cache.get_stale(query, video)
+        return result
+    
+    async def _search_youtube_native(self, query: str, video: bool) -> Optional[Dict[str, Any]]:
+        """Search YouTube with a single HTTP request, falling back to yt-dlp if the page can't be read"""
         try:
-            output_path = os.path.join(Config.DOWNLOADS_PATH, f"{track_info['title'][:50]}")
+            return await self.youtube_search.search(query, video)
+        except Exception as e:
+            logger.warning(f"Native YouTube search failed for '{query}', using yt-dlp: {e}")
+        
+        self.youtube_fallbacks += 1
+        return await extractor.run(self._search_youtube_sync, query, video, source='youtube')
+    
+    def _search_youtube_sync(self, query: str, video: bool) -> Optional[Dict[str, Any]]:
+        """Blocking flat YouTube search, run inside the extraction pool"""
+        with ydl_pool.get(self.ytdl_search_opts) as ydl:
+            # Search for the video
+            search_results = ydl.extract_info(
+                f"ytsearch:{query}",
+                download=False
+            )
             
-            opts = self.ytdl_video_opts.copy() if track_info.get('is_video') else self.ytdl_opts.copy()
-            opts['outtmpl'] = f"{output_path}.%(ext)s"
+            if not search_results or not search_results.get('entries'):
+                return None
             
-            with yt_dlp.YoutubeDL(opts) as ydl:
-                ydl.download([track_info['webpage_url']])
+            # Get the first result
+            return self._flat_entry_info(search_results['entries'][0], video)
+    
+    def _search_soundcloud_sync(self, query: str, video: bool) -> Optional[Dict[str, Any]]:
+        """Blocking SoundCloud search, run inside the extraction pool"""
+        with ydl_pool.get(self.ytdl_opts) as ydl:
+            if Config.SOUNDCLOUD_CLIENT_ID:
+                # yt-dlp reads the client ID from its cache before scraping one
+                ydl.cache.store('soundcloud', 'client_id', Config.SOUNDCLOUD_CLIENT_ID)
             
-            # Find the downloaded file
-            for ext in ['.mp3', '.mp4', '.webm', '.m4a']:
-                file_path = f"{output_path}{ext}"
-                if os.path.exists(file_path):
-                    return file_path
+            # Flat SoundCloud results carry only a URL, so extract the first one fully
+            search_results = ydl.extract_info(f"scsearch1:{query}", download=False)
+            if not search_results or not search_results.get('entries'):
+                return None
+            return self._flat_entry_info(search_results['entries'][0], video)
+    
+    def _flat_entry_info(self, entry: Dict[str, Any], video: bool) -> Dict[str, Any]:
+        """Build track info from a flat search or playlist entry"""
+        webpage_url = entry.get('webpage_url') or entry.get('url')
+        if not webpage_url or not webpage_url.startswith('http'):
+            webpage_url = f"https://www.youtube.com/watch?v={entry.get('id')}"
+        
+        thumbnail = entry.get('thumbnail')
+        if not thumbnail and entry.get('thumbnails'):
+            thumbnail = entry['thumbnails'][-1].get('url')
+        
+        return {
+            'title': entry.get('title', 'Unknown'),
+            'url': None,  # resolved once the track nears the head of the queue
+            'webpage_url': webpage_url,
+            'duration': int(entry.get('duration') or 0),
+            'thumbnail': thumbnail,
+            'uploader': entry.get('uploader') or entry.get('channel') or 'Unknown',
+            'view_count': entry.get('view_count', 0),
+            'is_video': video
+        }
+    
+    async def iter_playlist(self, url: str, video: bool = False, limit: Optional[int] = None,
+                            chat_id: Optional[int] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield pages of flat playlist entries, extracting the next page only when asked for it"""
+        start = 1
+        while limit is None or start <= limit:
+            end = start + Config.PLAYLIST_PAGE_SIZE - 1
+            if limit is not None:
+                end = min(end, limit)
             
-            return None
+            entries, listed = await extractor.run(
+                self._playlist_page_sync, url, start, end, video, chat_id=chat_id
+            )
+            if entries:
+                yield entries
             
+            if listed < end - start + 1:
+                # Short page, the playlist is exhausted
+                break
+            start = end + 1
+    
+    def _playlist_page_sync(self, url: str, start: int, end: int, video: bool) -> Tuple[List[Dict[str, Any]], int]:
+        """Blocking flat extraction of one playlist page, run inside the extraction pool"""
+        opts = self.ytdl_search_opts.copy()
+        opts['noplaylist'] = False
+        
+        with ydl_pool.get(opts, playlist_items=f"{start}-{end}") as ydl:
+            playlist = ydl.extract_info(url, download=False)
+            if not playlist:
+                return [], 0
+            
+            listed = list(playlist.get('entries') or [])
+            # Deleted and private videos come back without an id
+            entries = [self._flat_entry_info(entry, video) for entry in listed if entry and entry.get('id')]
+            return entries, len(listed)
+    
+    def _select_stream_url(self, ydl: yt_dlp.YoutubeDL, video_info: Dict[str, Any], video: bool) -> Optional[str]:
+        """Pick the direct stream URL for the preferred format"""
+        if 'formats' not in video_info:
+            return video_info.get('url')
+        
+        if video:
+            # For video, get best video format
+            format_selector = ydl.build_format_selector('best[height<=720][ext=mp4]/best[ext=mp4]/best')
+        else:
+            # For audio, get best audio format
+            format_selector = ydl.build_format_selector('bestaudio[ext=m4a]/bestaudio/best')
+        
+        formats = list(format_selector({'formats': video_info['formats']}))
+        return formats[0]['url'] if formats else video_info.get('url')
+    
+    async def resolve_stream_url(self, webpage_url: str, video: bool = False,
+                                 chat_id: Optional[int] = None) -> Optional[str]:
+        """Resolve a fresh direct stream URL for a video page"""
+        try:
+            return await self.resolve_flights.do(
+                (webpage_url, video),
+                lambda: self._resolve_and_cache(webpage_url, video, chat_id),
+                chat_id
+            )
+        except (JobCancelled, SourceUnavailable):
+            raise
+        except Exception as e:
+            logger.error(f"Stream URL resolution error: {e}")
+            return None
+    
+    async def _resolve_and_cache(self, webpage_url: str, video: bool, chat_id: Optional[int] = None) -> Optional[str]:
+        """Run one format extraction and cache the resulting URL"""
+        url = await extractor.run(
+            self._resolve_stream_url_sync, webpage_url, video,
+            source=source_for_url(webpage_url), chat_id=chat_id
+        )
+        if url:
+            self.stream_cache.put(webpage_url, video, url)
+        return url
+    
+    def _resolve_stream_url_sync(self, webpage_url: str, video: bool) -> Optional[str]:
+        """Blocking format extraction for a single video, run inside the extraction pool"""
+        opts = self.ytdl_video_opts if video else self.ytdl_opts
+        
+        with ydl_pool.get(opts) as ydl:
+            video_info = ydl.extract_info(webpage_url, download=False)
+            if not video_info:
+                return None
+            return self._select_stream_url(ydl, video_info, video)
+    
+    async def get_stream_url(self, track: Track, valid_for: float = 0,
+                             chat_id: Optional[int] = None, store: bool = True) -> Optional[str]:
+        """Get a playable URL for a track, re-resolving only if it went stale
+        
+        Pass store=False outside the chat's actor and hand the URL to set_track_url.
+        """
+        url = track.url
+        if url and self.stream_cache.is_fresh(url, valid_for):
+            return url
+        
+        if not track.webpage_url:
+            return url
+        
+        url = self.stream_cache.get(track.webpage_url, track.is_video, valid_for)
+        if not url:
+            logger.info(f"Resolving stream URL for {track.title}")
+            url = await self.resolve_stream_url(track.webpage_url, track.is_video, chat_id)
+        
+        if url and store:
+            track.url = url
+        return url
+    
+    async def set_track_url(self, chat_id: int, track: Track, url: Optional[str]):
+        """Store a URL resolved by the prefetcher on a queued track"""
+        await self.actors.submit(chat_id, self._set_track_url, chat_id, track, url)
+    
+    async def _set_track_url(self, chat_id: int, track: Track, url: Optional[str]):
+        """Store a URL resolved by the prefetcher on a queued track"""
+        if self._is_queued(chat_id, track):
+            track.url = url
+    
+    async def attach_file(self, chat_id: int, track: Track, file_path: str) -> bool:
+        """Let a queued track play from a prefetched download"""
+        return await self.actors.submit(chat_id, self._attach_file, chat_id, track, file_path)
+    
+    async def _attach_file(self, chat_id: int, track: Track, file_path: str) -> bool:
+        """Let a queued track play from a prefetched download"""
+        # Every queued track holding the file counts as a user, the same video may be queued in several chats
+        acquire_downloaded_file(file_path)
+        if track.file_path or not self._is_queued(chat_id, track) or not os.path.exists(file_path):
+            # Left the queue while downloading, drop the file unless another track uses it
+            release_downloaded_file(file_path)
+            return False
+        
+        track.file_path = file_path
+        return True
+    
+    def _is_queued(self, chat_id: int, track: Track) -> bool:
+        """Check a track object is still in the chat's queue"""
+        state = self.chats.get(chat_id)
+        return bool(state) and any(queued is track for queued in state.queue)
+    
+    def _release_files(self, tracks):
+        """Drop the prefetched files of tracks leaving the queue"""
+        for track in tracks:
+            if track.file_path:
+                release_downloaded_file(track.file_path)
+                track.file_path = None
+    
+    async def download_track(self, track_info: Track, chat_id: Optional[int] = None) -> Optional[str]:
+        """Download track for local playback"""
+        try:
+            return await self.download_flights.do(
+                (track_info.webpage_url, track_info.is_video),
+                lambda: extractor.run(
+                    self._download_track_sync, track_info,
+                    source=download_source_for_url(track_info.webpage_url),
+                    chat_id=chat_id,
+                    timeout=Config.DOWNLOAD_TIMEOUT
+                ),
+                chat_id
+            )
         except Exception as e:
             logger.error(f"Download error: {e}")
             return None
     
-    async def add_to_queue(self, chat_id: int, query: str, requester: User, video: bool = False) -> Optional[Dict[str, Any]]:
+    def _download_track_sync(self, track_info: Track) -> Optional[str]:
+        """Blocking track download, run inside the extraction pool"""
+        # Name the file after the video, titles may contain path separators
+        video_id = youtube_video_id(track_info.webpage_url)
+        name = video_id or sanitize_filename(track_info.title) or 'track'
+        output_path = os.path.join(Config.DOWNLOADS_PATH, f"{name}_{'video' if track_info.is_video else 'audio'}")
+        
+        opts = self.ytdl_video_opts.copy() if track_info.is_video else self.ytdl_opts.copy()
+        opts['progress_hooks'] = [cancel_hook]
+        
+        with ydl_pool.get(opts, outtmpl=f"{output_path}.%(ext)s") as ydl:
+            ydl.download([track_info.webpage_url])
+        
+        # Find the downloaded file
+        for ext in ['.mp3', '.mp4', '.webm', '.m4a']:
+            file_path = f"{output_path}{ext}"
+            if os.path.exists(file_path):
+                return file_path
+        
+        return None
+    
+    async def add_to_queue(self, chat_id: int, query: str, requester: User, video: bool = False) -> Optional[Track]:
         """Add track to queue"""
         try:
             # Search for track
-            track_info = await self.search_youtube(query, video)
+            with extraction_context(PRIORITY_INTERACTIVE, chat_id, requester.id):
+                track_info = await self.search_youtube(query, video)
             if not track_info:
                 return None
             
-            # Prepare track data
-            track_data = {
-                'title': track_info['title'],
-                'url': track_info['url'],
-                'webpage_url': track_info['webpage_url'],
-                'duration': track_info['duration'],
-                'thumbnail': track_info.get('thumbnail'),
-                'uploader': track_info.get('uploader'),
-                'requester': {
-                    'id': requester.id,
-                    'first_name': requester.first_name,
-                    'username': requester.username
-                },
-                'is_video': video
-            }
-            
-            # Add to database queue
-            await self.db.add_to_queue(chat_id, {
-                'title': track_data['title'],
-                'url': track_data['url'],
-                'duration': track_data['duration'],
-                'requester_id': requester.id,
-                'requester_name': requester.first_name,
-                'is_video': video
-            })
+            track = Track.from_info(track_info, Requester.from_user(requester), video)
+            await self.actors.submit(chat_id, self._enqueue, chat_id, track)
+            return track
             
-            # Add to memory queue
-            if chat_id not in self.queues:
-                self.queues[chat_id] = []
+        except Exception as e:
+            logger.error(f"Error adding to queue: {e}")
+            return None
+    
+    async def add_playlist(self, chat_id: int, url: str, requester: User, video: bool = False,
+                           client: Optional[Client] = None,
+                           progress: Optional[Callable[[int], Awaitable[None]]] = None) -> int:
+        """Queue a YouTube playlist as its pages arrive, returning how many tracks were added"""
+        try:
+            room = max(0, Config.MAX_QUEUE_SIZE - len(await self.get_queue(chat_id)))
+            if not room:
+                return 0
             
-            self.queues[chat_id].append(track_data)
+            owner = Requester.from_user(requester)
+            generation = self.generations.get(chat_id, 0)
+            added = 0
+            starter = None
             
-            return track_data
+            # Playlist pages yield to /play requests and take turns with other chats
+            with extraction_context(PRIORITY_BULK, chat_id, requester.id):
+                async for entries in self.iter_playlist(url, video, limit=room, chat_id=chat_id):
+                    if self.generations.get(chat_id, 0) != generation:
+                        raise JobCancelled(f"Playlist import into {chat_id} was stopped")
+                    tracks = [Track.from_info(entry, owner, video) for entry in entries]
+                    await self.actors.submit(chat_id, self._enqueue_many, chat_id, tracks)
+                    added += len(tracks)
+                    
+                    # Start on the first page instead of waiting for the whole playlist
+                    if client and starter is None:
+                        starter = asyncio.create_task(self.play_if_idle(chat_id, client))
+                    if progress:
+                        await progress(added)
             
+            if starter:
+                await starter
+            logger.info(f"Queued {added} playlist tracks in {chat_id}")
+            return added
+        except JobCancelled:
+            logger.info(f"Playlist import stopped in {chat_id}")
+            return 0
         except Exception as e:
-            logger.error(f"Error adding to queue: {e}")
-            return None
+            logger.error(f"Error adding playlist: {e}")
+            return 0
+    
+    async def _enqueue(self, chat_id: int, track: Track):
+        """Append a track to the database and memory queues"""
+        await self._enqueue_many(chat_id, [track])
+    
+    async def _enqueue_many(self, chat_id: int, tracks: List[Track]):
+        """Append tracks to the database and memory queues in one batch"""
+        for track in tracks:
+            await self.db.add_to_queue(chat_id, {
+                'title': track.title,
+                'url': track.webpage_url,
+                'duration': track.duration,
+                'requester_id': track.requester.id,
+                'requester_name': track.requester.first_name,
+                'is_video': track.is_video
+            })
+        
+        self.get_state(chat_id).queue.extend(tracks)
+        self.prefetcher.notify(chat_id)
     
-    async def get_queue(self, chat_id: int) -> List[Dict[str, Any]]:
+    def get_state(self, chat_id: int) -> ChatState:
+        """Get a chat's player state, creating it on first use"""
+        state = self.chats.get(chat_id)
+        if state is None:
+            state = self.chats[chat_id] = ChatState()
+        return state
+    
+    async def get_queue(self, chat_id: int) -> List[Track]:
+        """Get current queue"""
+        return await self.actors.submit(chat_id, self._get_queue, chat_id)
+    
+    async def _get_queue(self, chat_id: int) -> List[Track]:
         """Get current queue"""
-        return self.queues.get(chat_id, [])
+        state = self.chats.get(chat_id)
+        return list(state.queue) if state else []
     
     async def clear_queue(self, chat_id: int):
         """Clear queue"""
-        self.queues[chat_id] = []
+        await self.actors.submit(chat_id, self._clear_queue, chat_id)
+    
+    async def _clear_queue(self, chat_id: int):
+        """Clear queue"""
+        state = self.get_state(chat_id)
+        self._release_files(state.queue)
+        state.queue.clear()
+        # The head of the queue is the playing track, so it goes too
+        state.current = None
         await self.db.clear_queue(chat_id)
     
     async def shuffle_queue(self, chat_id: int) -> bool:
         """Shuffle queue"""
-        if chat_id not in self.queues or len(self.queues[chat_id]) <= 1:
+        return await self.actors.submit(chat_id, self._shuffle_queue, chat_id)
+    
+    async def _shuffle_queue(self, chat_id: int) -> bool:
+        """Shuffle queue"""
+        state = self.chats.get(chat_id)
+        if not state or len(state.queue) <= 1:
             return False
         
         # Keep first track (currently playing) and shuffle the rest
-        if len(self.queues[chat_id]) > 1:
-            tracks_to_shuffle = self.queues[chat_id][1:]
-            random.shuffle(tracks_to_shuffle)
-            self.queues[chat_id] = [self.queues[chat_id][0]] + tracks_to_shuffle
+        tracks = list(state.queue)
+        order = list(range(1, len(tracks)))
+        random.shuffle(order)
+        state.queue = deque([tracks[0]] + [tracks[i] for i in order])
         
-        # Update database
-        await self.db.shuffle_queue(chat_id)
+        # Store the same order, so a restart restores what users saw
+        await self.db.shuffle_queue(chat_id, order)
         return True
     
     async def play_next(self, chat_id: int, client: Client):
+        """Play next track in queue"""
+        await self.actors.submit(chat_id, self._play_next, chat_id, client)
+    
+    async def _play_next(self, chat_id: int, client: Client, offset: float = 0.0):
         """Play next track in queue"""
         try:
-            if chat_id not in self.queues or not self.queues[chat_id]:
+            state = self.chats.get(chat_id)
+            if not state or not state.queue:
+                if state:
+                    state.current = None
+                await self.db.remove_player_session(chat_id)
                 return
             
-            pytgcalls = await self.get_pytgcalls(chat_id, client)
-            track = self.queues[chat_id][0]
-            self.current_tracks[chat_id] = track
+            started = time.monotonic()
+            track = state.queue[0]
+            state.current = track
             
-            # Prepare stream
-            if track.get('is_video'):
-                stream = VideoPiped(
-                    track['url'],
-                    HighQualityVideo(),
-                    HighQualityAudio()
-                )
+            # Prefer a prefetched local copy, else resolve the URL lazily if it expired
+            if track.file_path and os.path.exists(track.file_path):
+                stream_url = track.file_path
             else:
-                stream = AudioPiped(
-                    track['url'],
-                    HighQualityAudio()
-                )
+                stream_url = await self.get_stream_url(track, chat_id=chat_id)
+            if not stream_url:
+                raise ValueError(f"Could not resolve stream for {track.title}")
             
-            # Join voice chat and play
-            try:
-                await pytgcalls.join_group_call(
-                    chat_id,
-                    stream,
-                    stream_type=StreamType().video_audio if track.get('is_video') else StreamType().audio
-                )
-            except NoActiveGroupCall:
-                # No active voice chat
-                logger.warning(f"No active voice chat in {chat_id}")
-                return
-            except Exception as e:
-                logger.error(f"Error joining voice chat: {e}")
-                return
+            stream = self._build_stream(track, stream_url, build_ffmpeg_parameters(
+                offset, speed=state.speed, video=track.is_video
+            ))
             
-            logger.info(f"Playing: {track['title']} in {chat_id}")
+            # Already in the call: switch the input in place instead of rejoining
+            pytgcalls = self.calls.get(chat_id)
+            if pytgcalls:
+                try:
+                    await pytgcalls.change_stream(chat_id, stream)
+                except NotInGroupCallError:
+                    # The call ended under us, fall back to a fresh join
+                    self.calls.detach(chat_id)
+                    pytgcalls = None
             
+            if not pytgcalls:
+                pytgcalls = await self.calls.get_instance(client)
+                
+                # Join voice chat and play
+                try:
+                    await pytgcalls.join_group_call(chat_id, stream)
+                except NoActiveGroupCall:
+                    # No active voice chat
+                    logger.warning(f"No active voice chat in {chat_id}")
+                    state.current = None
+                    if self.assistant_pool:
+                        self.assistant_pool.release(chat_id)
+                    return
+                except FloodWait as e:
+                    state.current = None
+                    if not self.assistant_pool:
+                        logger.error(f"Flood wait joining voice chat: {e.value}s")
+                        return
+                    # Try again on another assistant while this one cools down
+                    self.assistant_pool.mark_rate_limited(client, e.value)
+                    retry_client = self.assistant_pool.get_client(chat_id)
+                    if retry_client is not client:
+                        await self._play_next(chat_id, retry_client)
+                    return
+                except Exception as e:
+                    logger.error(f"Error joining voice chat: {e}")
+                    state.current = None
+                    return
+                
+                self.calls.attach(chat_id, client)
+            
+            state.clock = PlaybackClock(offset, state.speed)
+            state.stream_id += 1
+            self._record_transition(chat_id, time.monotonic() - started)
+            logger.info(f"Playing: {track.title} in {chat_id}")
+            self.prefetcher.track_started(chat_id, track)
+            
+            # Remember the chat so a restart can pick it back up
+            serving = self.calls.get_client(chat_id) or client
+            await self.db.save_player_sessions([(chat_id, serving.name, offset)])
+            if Config.TRACK_INDEX_ENABLED and not offset:
+                await self.track_index.add(track)
+            
+        except JobCancelled:
+            # Stopped while resolving, leave the queue to /stop
+            logger.info(f"Playback start cancelled in {chat_id}")
+            if state:
+                state.current = None
+        except SourceUnavailable as e:
+            # The track is fine, its source is failing; keep it and try again once the breaker probes
+            state.current = None
+            delay = max(extractor.breaker(source_for_url(track.webpage_url)).retry_in(), 1.0)
+            logger.warning(f"Not starting {track.title} in {chat_id}, retrying in {delay:.0f}s: {e}")
+            self._schedule_play_retry(chat_id, client, delay, offset)
         except Exception as e:
             logger.error(f"Error playing track: {e}")
-            await self.skip_track(chat_id, client)
+            await self._skip_track(chat_id, client)
+    
+    def _schedule_play_retry(self, chat_id: int, client: Client, delay: float, offset: float):
+        """Start the queue again after a delay, unless a retry is already waiting"""
+        retry = self.play_retries.get(chat_id)
+        if retry and not retry.done():
+            return
+        self.play_retries[chat_id] = asyncio.create_task(self._retry_play(chat_id, client, delay, offset))
+    
+    async def _retry_play(self, chat_id: int, client: Client, delay: float, offset: float):
+        """Wait out a failing source, then start the queue unless something started it meanwhile"""
+        try:
+            await asyncio.sleep(delay)
+            if self.play_retries.get(chat_id) is asyncio.current_task():
+                del self.play_retries[chat_id]
+            await self.actors.submit(chat_id, self._play_if_idle, chat_id, client, offset)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Error retrying playback in {chat_id}: {e}")
+    
+    def _build_stream(self, track: Track, stream_url: str, ffmpeg_parameters: str = ''):
+        """Build the pytgcalls input stream for a track"""
+        if track.is_video:
+            return VideoPiped(
+                stream_url,
+                audio_parameters=HighQualityAudio(),
+                video_parameters=HighQualityVideo(),
+                additional_ffmpeg_parameters=ffmpeg_parameters
+            )
+        return AudioPiped(
+            stream_url,
+            audio_parameters=HighQualityAudio(),
+            additional_ffmpeg_parameters=ffmpeg_parameters
+        )
+    
+    async def _restart_stream(self, chat_id: int, position: float) -> bool:
+        """Restart the current track in place from a position without touching the queue"""
+        pytgcalls = self.calls.get(chat_id)
+        state = self.chats.get(chat_id)
+        track = state.current if state else None
+        if not pytgcalls or not track:
+            return False
+        
+        duration = track.duration or 0
+        position = max(0.0, position)
+        if duration:
+            position = min(position, max(0.0, duration - 1))
+        
+        exact = True
+        file_path = track.file_path
+        if file_path and os.path.exists(file_path):
+            stream_url = file_path
+            if track.is_video:
+                # Start on a keyframe so ffmpeg can jump straight there
+                keyframe = await self.keyframes.snap(file_path, position)
+                if keyframe is not None:
+                    position = keyframe
+                    exact = False
+        else:
+            stream_url = await self.get_stream_url(track, valid_for=max(0, duration - position), chat_id=chat_id)
+        if not stream_url:
+            return False
+        
+        stream = self._build_stream(track, stream_url, build_ffmpeg_parameters(
+            position, exact, state.speed, track.is_video
+        ))
+        await pytgcalls.change_stream(chat_id, stream)
+        state.stream_id += 1
+        
+        if state.clock is None:
+            state.clock = PlaybackClock()
+        state.clock.restart(position, state.speed)
+        return True
+    
+    def get_position(self, chat_id: int) -> float:
+        """Get the playback position of the current track in seconds"""
+        state = self.chats.get(chat_id)
+        return state.clock.position() if state and state.clock else 0.0
+    
+    def _record_transition(self, chat_id: int, elapsed: float):
+        """Track time-to-audio for track starts against the configured target"""
+        elapsed_ms = elapsed * 1000
+        stats = self.transition_stats
+        stats['count'] += 1
+        stats['total_ms'] += elapsed_ms
+        stats['last_ms'] = round(elapsed_ms, 1)
+        
+        if elapsed_ms > Config.TRANSITION_TARGET_MS:
+            stats['over_target'] += 1
+            logger.warning(
+                f"Track start in {chat_id} took {elapsed_ms:.0f} ms "
+                f"(target {Config.TRANSITION_TARGET_MS} ms)"
+            )
+    
+    async def play_if_idle(self, chat_id: int, client: Client):
+        """Start the queue unless the chat is already playing"""
+        await self.actors.submit(chat_id, self._play_if_idle, chat_id, client)
+    
+    async def _play_if_idle(self, chat_id: int, client: Client, offset: float = 0.0):
+        """Start the queue unless the chat is already playing"""
+        if not await self.is_playing(chat_id):
+            await self._play_next(chat_id, client, offset)
+    
+    async def migrate(self, chat_id: int, client: Client):
+        """Move a chat's playback to another client"""
+        await self.actors.submit(chat_id, self._migrate, chat_id, client)
+    
+    async def _migrate(self, chat_id: int, client: Client):
+        """Move a chat's playback to another client"""
+        self.calls.detach(chat_id)
+        await self._play_next(chat_id, client)
     
     async def skip_track(self, chat_id: int, client: Client):
+        """Skip current track"""
+        await self.actors.submit(chat_id, self._skip_track, chat_id, client)
+    
+    async def _skip_track(self, chat_id: int, client: Client):
         """Skip current track"""
         try:
-            if chat_id in self.queues and self.queues[chat_id]:
+            state = self.chats.get(chat_id)
+            if state and state.queue:
                 # Remove current track
-                self.queues[chat_id].pop(0)
+                self._release_files([state.queue.popleft()])
                 await self.db.remove_from_queue(chat_id)
             
             # Play next track
-            await self.play_next(chat_id, client)
+            await self._play_next(chat_id, client)
             
         except Exception as e:
             logger.error(f"Error skipping track: {e}")
     
+    def _bump_generation(self, chat_id: int):
+        """Mark work started for a chat so far as stale"""
+        self.generations[chat_id] = self.generations.get(chat_id, 0) + 1
+    
     async def stop(self, chat_id: int, client: Client):
+        """Stop playback and clear queue"""
+        # Abort imports and resolutions first, the actor may be waiting on one
+        self._bump_generation(chat_id)
+        extractor.cancel_chat(chat_id)
+        await self.actors.submit(chat_id, self._stop, chat_id, client)
+    
+    async def _stop(self, chat_id: int, client: Client):
         """Stop playback and clear queue"""
         try:
-            if chat_id in self.active_calls:
-                pytgcalls = self.active_calls[chat_id]
+            pytgcalls = self.calls.get(chat_id)
+            if pytgcalls:
                 await pytgcalls.leave_group_call(chat_id)
             
-            await self.cleanup_chat(chat_id)
+            await self._cleanup_chat(chat_id)
             
         except Exception as e:
             logger.error(f"Error stopping playback: {e}")
     
     async def pause(self, chat_id: int) -> bool:
+        """Pause playback"""
+        return await self.actors.submit(chat_id, self._pause, chat_id)
+    
+    async def _pause(self, chat_id: int) -> bool:
         """Pause playback"""
         try:
-            if chat_id in self.active_calls:
-                pytgcalls = self.active_calls[chat_id]
+            pytgcalls = self.calls.get(chat_id)
+            if pytgcalls:
                 await pytgcalls.pause_stream(chat_id)
+                state = self.chats.get(chat_id)
+                if state and state.clock:
+                    state.clock.pause()
                 return True
         except Exception as e:
             logger.error(f"Error pausing: {e}")
         return False
     
     async def resume(self, chat_id: int) -> bool:
+        """Resume playback"""
+        return await self.actors.submit(chat_id, self._resume, chat_id)
+    
+    async def _resume(self, chat_id: int) -> bool:
         """Resume playback"""
         try:
-            if chat_id in self.active_calls:
-                pytgcalls = self.active_calls[chat_id]
+            pytgcalls = self.calls.get(chat_id)
+            if pytgcalls:
                 await pytgcalls.resume_stream(chat_id)
+                state = self.chats.get(chat_id)
+                if state and state.clock:
+                    state.clock.resume()
                 return True
         except Exception as e:
             logger.error(f"Error resuming: {e}")
         return False
     
     async def set_volume(self, chat_id: int, volume: int) -> bool:
+        """Set playback volume"""
+        return await self.actors.submit(chat_id, self._set_volume, chat_id, volume)
+    
+    async def _set_volume(self, chat_id: int, volume: int) -> bool:
         """Set playback volume"""
         try:
-            if chat_id in self.active_calls and 0 <= volume <= 200:
-                pytgcalls = self.active_calls[chat_id]
+            pytgcalls = self.calls.get(chat_id)
+            if pytgcalls and 0 <= volume <= 200:
                 await pytgcalls.change_volume_call(chat_id, volume)
-                self.volumes[chat_id] = volume
+                self.get_state(chat_id).volume = volume
                 
                 # Update in database
                 settings = await self.db.get_chat_settings(chat_id)
@@ -313,42 +796,84 @@ class MusicPlayer:
         return False
     
     async def set_speed(self, chat_id: int, speed: float) -> bool:
+        """Set playback speed"""
+        return await self.actors.submit(chat_id, self._set_speed, chat_id, speed)
+    
+    async def _set_speed(self, chat_id: int, speed: float) -> bool:
         """Set playback speed"""
         try:
             if 0.5 <= speed <= 2.0:
-                self.speeds[chat_id] = speed
-                # Note: PyTgCalls doesn't directly support speed change
-                # This would require restarting the stream with speed parameter
+                state = self.get_state(chat_id)
+                state.speed = speed
+                
+                # Coalesce bursts of button presses into a single stream restart
+                if state.speed_change and not state.speed_change.done():
+                    state.speed_change.cancel()
+                state.speed_change = asyncio.create_task(self._apply_speed(chat_id))
                 return True
         except Exception as e:
             logger.error(f"Error setting speed: {e}")
         return False
     
+    async def _apply_speed(self, chat_id: int):
+        """Re-pipe the current track at the chat's speed once the setting settles"""
+        try:
+            await asyncio.sleep(Config.SPEED_DEBOUNCE)
+            await self.actors.submit(chat_id, self._respeed, chat_id)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Error applying speed: {e}")
+        finally:
+            state = self.chats.get(chat_id)
+            if state and state.speed_change is asyncio.current_task():
+                state.speed_change = None
+    
+    async def _respeed(self, chat_id: int):
+        """Restart the current track from its position if its speed is out of date"""
+        state = self.chats.get(chat_id)
+        if not state:
+            return
+        
+        settings = await self.db.get_chat_settings(chat_id)
+        settings['speed'] = state.speed
+        await self.db.update_chat_settings(chat_id, settings)
+        
+        if state.clock and state.clock.speed == state.speed:
+            return
+        await self._restart_stream(chat_id, self.get_position(chat_id))
+    
     async def seek(self, chat_id: int, position: int) -> bool:
+        """Seek to position in current track"""
+        return await self.actors.submit(chat_id, self._seek, chat_id, position)
+    
+    async def _seek(self, chat_id: int, position: int) -> bool:
         """Seek to position in current track"""
         try:
-            if chat_id in self.active_calls:
-                # Note: PyTgCalls doesn't directly support seeking
-                # This would require restarting the stream from the position
-                logger.warning("Seek functionality not fully implemented")
-                return True
+            return await self._restart_stream(chat_id, position)
         except Exception as e:
             logger.error(f"Error seeking: {e}")
         return False
     
     async def seekback(self, chat_id: int, seconds: int) -> bool:
+        """Seek backward in current track"""
+        return await self.actors.submit(chat_id, self._seekback, chat_id, seconds)
+    
+    async def _seekback(self, chat_id: int, seconds: int) -> bool:
         """Seek backward in current track"""
         try:
-            # This would calculate current position and seek back
-            logger.warning("Seekback functionality not fully implemented")
-            return True
+            return await self._restart_stream(chat_id, self.get_position(chat_id) - seconds)
         except Exception as e:
             logger.error(f"Error seeking back: {e}")
         return False
     
     async def set_loop(self, chat_id: int, enabled: bool):
         """Enable/disable loop for current track"""
-        self.loop_status[chat_id] = enabled
+        await self.actors.submit(chat_id, self._set_loop, chat_id, enabled)
+    
+    async def _set_loop(self, chat_id: int, enabled: bool):
+        """Enable/disable loop for current track"""
+        self.get_state(chat_id).loop_enabled = enabled
         
         # Update in database
         settings = await self.db.get_chat_settings(chat_id)
@@ -357,7 +882,11 @@ class MusicPlayer:
     
     async def set_loop_count(self, chat_id: int, count: int):
         """Set loop count"""
-        self.loop_counts[chat_id] = count
+        await self.actors.submit(chat_id, self._set_loop_count, chat_id, count)
+    
+    async def _set_loop_count(self, chat_id: int, count: int):
+        """Set loop count"""
+        self.get_state(chat_id).loop_count = count
         
         # Update in database
         settings = await self.db.get_chat_settings(chat_id)
@@ -366,90 +895,382 @@ class MusicPlayer:
     
     async def get_loop_status(self, chat_id: int) -> bool:
         """Get loop status"""
-        return self.loop_status.get(chat_id, False)
+        return await self.actors.submit(chat_id, self._get_loop_status, chat_id)
+    
+    async def _get_loop_status(self, chat_id: int) -> bool:
+        """Get loop status"""
+        state = self.chats.get(chat_id)
+        return state.loop_enabled if state else False
     
     async def on_track_end(self, chat_id: int, client: Client):
+        """Handle when a track ends"""
+        # Note which stream was playing now, a skip queued ahead may replace it before the actor gets here
+        state = self.chats.get(chat_id)
+        stream_id = state.stream_id if state else None
+        await self.actors.submit(chat_id, self._on_track_end, chat_id, client, stream_id)
+    
+    async def _on_track_end(self, chat_id: int, client: Client, stream_id: Optional[int] = None):
         """Handle when a track ends"""
         try:
-            current_track = self.current_tracks.get(chat_id)
-            if not current_track:
+            state = self.chats.get(chat_id)
+            if not state or not state.current:
+                return
+            if stream_id is not None and stream_id != state.stream_id:
+                logger.info(f"Ignoring the end of a replaced stream in {chat_id}")
                 return
             
             # Check if loop is enabled
-            if self.loop_status.get(chat_id, False):
-                loop_count = self.loop_counts.get(chat_id, 1)
+            if state.loop_enabled:
+                loop_count = state.loop_count
                 if loop_count > 1:
                     # Decrease loop count and replay
-                    self.loop_counts[chat_id] = loop_count - 1
-                    await self.play_next(chat_id, client)
+                    state.loop_count = loop_count - 1
+                    await self._play_next(chat_id, client)
                     return
                 elif loop_count == -1:  # Infinite loop
-                    await self.play_next(chat_id, client)
+                    await self._play_next(chat_id, client)
                     return
             
             # Remove current track and play next
-            if chat_id in self.queues and self.queues[chat_id]:
-                self.queues[chat_id].pop(0)
+            if state.queue:
+                self._release_files([state.queue.popleft()])
                 await self.db.remove_from_queue(chat_id)
             
             # Play next track
-            await self.play_next(chat_id, client)
+            await self._play_next(chat_id, client)
             
         except Exception as e:
             logger.error(f"Error handling track end: {e}")
     
-    async def get_current_track(self, chat_id: int) -> Optional[Dict[str, Any]]:
+    async def get_current_track(self, chat_id: int) -> Optional[Track]:
         """Get currently playing track"""
-        return self.current_tracks.get(chat_id)
+        state = self.chats.get(chat_id)
+        return state.current if state else None
     
     async def is_playing(self, chat_id: int) -> bool:
         """Check if music is playing in chat"""
-        return chat_id in self.active_calls and chat_id in self.current_tracks
+        state = self.chats.get(chat_id)
+        return self.calls.is_active(chat_id) and bool(state and state.current)
     
     async def cleanup_chat(self, chat_id: int):
         """Cleanup chat data"""
-        self.queues.pop(chat_id, None)
-        self.current_tracks.pop(chat_id, None)
-        self.loop_status.pop(chat_id, None)
-        self.loop_counts.pop(chat_id, None)
-        self.speeds.pop(chat_id, None)
-        self.volumes.pop(chat_id, None)
-        self.active_calls.pop(chat_id, None)
+        self._bump_generation(chat_id)
+        extractor.cancel_chat(chat_id)
+        await self.actors.submit(chat_id, self._cleanup_chat, chat_id)
+    
+    async def _cleanup_chat(self, chat_id: int):
+        """Cleanup chat data"""
+        self.prefetcher.cancel(chat_id)
+        retry = self.play_retries.pop(chat_id, None)
+        if retry:
+            retry.cancel()
+        state = self.chats.pop(chat_id, None)
+        if state:
+            self._release_files(state.queue)
+            if state.speed_change:
+                state.speed_change.cancel()
+        self.calls.detach(chat_id)
+        if self.assistant_pool:
+            self.assistant_pool.release(chat_id)
         
         # Clear database queue
         await self.db.clear_queue(chat_id)
+        await self.db.remove_player_session(chat_id)
+    
+    async def _hydrate(self, chat_id: int):
+        """Load a chat's queue and settings from the database on first use after a restart"""
+        if chat_id in self.chats:
+            return
+        
+        rows = await self.db.get_queue(chat_id)
+        settings = await self.db.get_chat_settings(chat_id)
+        
+        state = ChatState()
+        for row in rows:
+            # Prefetched files are not restored, the prefetcher downloads them again
+            state.queue.append(Track(
+                title=row['title'],
+                webpage_url=row['url'],
+                duration=row['duration'] or 0,
+                requester=Requester.get(row['requester_id'], row['requester_name']),
+                is_video=bool(row['is_video'])
+            ))
+        state.loop_enabled = bool(settings.get('loop_enabled', False))
+        state.loop_count = settings.get('loop_count', 1)
+        state.volume = settings.get('volume', 100)
+        state.speed = float(settings.get('speed', 1.0))
+        
+        if state.queue or state.loop_enabled or state.speed != 1.0:
+            self.chats[chat_id] = state
+            logger.info(f"Restored {len(state.queue)} queued track(s) in {chat_id}")
+    
+    async def resume_sessions(self, get_client: Callable[[int], Client]):
+        """Resume playback in chats that were playing before the last restart"""
+        try:
+            sessions = await self.db.get_player_sessions()
+        except Exception as e:
+            logger.error(f"Error loading player sessions: {e}")
+            return
+        
+        for session in sessions:
+            chat_id = session['chat_id']
+            try:
+                if self.assistant_pool and session.get('assistant'):
+                    # Rejoin on the same account when it is still around
+                    self.assistant_pool.assignments.setdefault(chat_id, session['assistant'])
+                await self.actors.submit(
+                    chat_id, self._resume_session, chat_id, get_client(chat_id), session.get('position') or 0.0
+                )
+            except Exception as e:
+                logger.error(f"Error resuming {chat_id}: {e}")
+    
+    async def _resume_session(self, chat_id: int, client: Client, position: float):
+        """Restart a chat's current track from where it stopped"""
+        if await self.is_playing(chat_id):
+            return
+        state = self.chats.get(chat_id)
+        if not state or not state.queue:
+            await self.db.remove_player_session(chat_id)
+            return
+        
+        duration = state.queue[0].duration
+        if duration and position >= duration - 1:
+            position = 0.0
+        logger.info(f"Resuming {chat_id} at {position:.0f}s")
+        await self._play_next(chat_id, client, offset=position)
+    
+    async def save_sessions(self):
+        """Record the position of every playing chat, e.g. before shutting down"""
+        sessions = []
+        for chat_id, state in self.chats.items():
+            client = self.calls.get_client(chat_id)
+            if client and state.current and state.clock:
+                sessions.append((chat_id, client.name, round(state.clock.position(), 1)))
+        try:
+            await self.db.save_player_sessions(sessions)
+        except Exception as e:
+            logger.error(f"Error saving player sessions: {e}")
     
     async def get_stats(self) -> Dict[str, Any]:
         """Get player statistics"""
         return {
-            'active_calls': len(self.active_calls),
-            'total_queues': len(self.queues),
-            'total_tracks_queued': sum(len(queue) for queue in self.queues.values()),
-            'currently_playing': len(self.current_tracks)
+            'active_calls': len(self.calls.chat_calls),
+            'total_queues': sum(1 for state in self.chats.values() if state.queue),
+            'total_tracks_queued': sum(len(state.queue) for state in self.chats.values()),
+            'currently_playing': sum(1 for state in self.chats.values() if state.current),
+            'extractor': extractor.get_stats(),
+            'ydl_pool': ydl_pool.get_stats(),
+            'search_cache': self.search_cache.get_stats(),
+            'stream_cache': self.stream_cache.get_stats(),
+            'prefetcher': self.prefetcher.get_stats(),
+            'calls': self.calls.get_stats(),
+            'actors': self.actors.get_stats(),
+            'queue_journal': self.db.journal.get_stats(),
+            'spotify': self.spotify.get_stats(),
+            'youtube_search': {**self.youtube_search.get_stats(), 'fallbacks': self.youtube_fallbacks},
+            'track_index': self.track_index.get_stats(),
+            'search_sources': self.search_sources.get_stats(),
+            'assistants': self.assistant_pool.get_stats() if self.assistant_pool else {},
+            'transitions': {
+                'count': self.transition_stats['count'],
+                'avg_ms': round(self.transition_stats['total_ms'] / self.transition_stats['count'], 1)
+                if self.transition_stats['count'] else 0.0,
+                'last_ms': self.transition_stats['last_ms'],
+                'over_target': self.transition_stats['over_target']
+            },
+            'singleflight': {
+                'search': self.search_flights.get_stats(),
+                'resolve': self.resolve_flights.get_stats(),
+                'download': self.download_flights.get_stats()
+            }
         }
     
     async def export_queue(self, chat_id: int) -> List[Dict[str, Any]]:
         """Export queue to JSON format"""
-        queue = self.queues.get(chat_id, [])
-        return [{
-            'title': track['title'],
-            'url': track.get('webpage_url', ''),
-            'duration': track['duration'],
-            'requester': track['requester']['first_name'],
-            'is_video': track.get('is_video', False)
-        } for track in queue]
-    
-    async def import_queue(self, chat_id: int, queue_data: List[Dict[str, Any]], requester: User):
-        """Import queue from JSON format"""
+        state = self.chats.get(chat_id)
+        return [track.to_dict() for track in state.queue] if state else []
+    
+    async def import_queue(self, chat_id: int, queue_data: List[Dict[str, Any]], requester: User,
+                           client: Optional[Client] = None,
+                           progress: Optional[Callable[[int, int], Awaitable[None]]] = None) -> int:
+        """Import queue from JSON format, returning how many tracks were added"""
         try:
-            for track_data in queue_data:
-                await self.add_to_queue(
-                    chat_id,
-                    track_data.get('title', ''),
-                    requester,
-                    video=track_data.get('is_video', False)
+            room = max(0, Config.MAX_QUEUE_SIZE - len(await self.get_queue(chat_id)))
+            entries = [entry for entry in queue_data if isinstance(entry, dict)][:room]
+            owner = Requester.from_user(requester)
+            
+            with extraction_context(PRIORITY_BULK, chat_id, requester.id):
+                added = await self._enqueue_ordered(
+                    chat_id, entries, lambda entry: self._import_entry(entry, owner),
+                    Config.IMPORT_CONCURRENCY, client, progress
                 )
-            return True
+            logger.info(f"Imported {added}/{len(entries)} tracks into {chat_id}")
+            return added
+        except JobCancelled:
+            logger.info(f"Queue import stopped in {chat_id}")
+            return 0
         except Exception as e:
             logger.error(f"Error importing queue: {e}")
-            return False
+            return 0
+    
+    async def add_spotify(self, chat_id: int, url: str, requester: User, video: bool = False,
+                          client: Optional[Client] = None,
+                          progress: Optional[Callable[[int, int], Awaitable[None]]] = None) -> int:
+        """Queue a Spotify track, album or playlist by matching each song on YouTube"""
+        try:
+            room = max(0, Config.MAX_QUEUE_SIZE - len(await self.get_queue(chat_id)))
+            if not room or not self.spotify.enabled:
+                return 0
+            
+            spotify_tracks = (await self.spotify.resolve(url, limit=room))[:room]
+            if not spotify_tracks:
+                return 0
+            
+            # Songs matched before, by any chat, skip the YouTube search
+            matches = await self.db.get_spotify_matches([t['id'] for t in spotify_tracks])
+            new_matches: List[Tuple[str, str, str, int]] = []
+            owner = Requester.from_user(requester)
+            
+            async def match(spotify_track: Dict[str, Any]) -> Optional[Track]:
+                return await self._match_spotify_track(spotify_track, matches, new_matches, owner, video)
+            
+            with extraction_context(PRIORITY_BULK, chat_id, requester.id):
+                try:
+                    added = await self._enqueue_ordered(
+                        chat_id, spotify_tracks, match, Config.SPOTIFY_MATCH_CONCURRENCY, client, progress
+                    )
+                finally:
+                    await self.db.save_spotify_matches(new_matches)
+            
+            logger.info(
+                f"Queued {added}/{len(spotify_tracks)} Spotify tracks in {chat_id} "
+                f"({len(matches)} already matched)"
+            )
+            return added
+        except JobCancelled:
+            logger.info(f"Spotify import stopped in {chat_id}")
+            return 0
+        except Exception as e:
+            logger.error(f"Error adding Spotify link: {e}")
+            return 0
+    
+    async def _match_spotify_track(self, spotify_track: Dict[str, Any], matches: Dict[str, Dict[str, Any]],
+                                   new_matches: List[Tuple[str, str, str, int]], requester: Requester,
+                                   video: bool) -> Optional[Track]:
+        """Find the YouTube video for a Spotify track, reusing a stored match if there is one"""
+        match = matches.get(spotify_track['id'])
+        if match:
+            return Track(
+                title=match['title'],
+                webpage_url=f"https://www.youtube.com/watch?v={match['video_id']}",
+                duration=match['duration'] or spotify_track['duration'],
+                requester=requester,
+                is_video=video
+            )
+        
+        query = f"{', '.join(spotify_track['artists'])} - {spotify_track['name']}"
+        track_info = await self.search_youtube(query, video)
+        if not track_info:
+            return None
+        
+        video_id = youtube_video_id(track_info['webpage_url'])
+        if video_id:
+            new_matches.append((spotify_track['id'], video_id, track_info['title'], track_info['duration']))
+        return Track.from_info(track_info, requester, video)
+    
+    async def _enqueue_ordered(self, chat_id: int, items: List[Any],
+                               resolve: Callable[[Any], Awaitable[Optional[Track]]],
+                               concurrency: int, client: Optional[Client] = None,
+                               progress: Optional[Callable[[int, int], Awaitable[None]]] = None) -> int:
+        """Resolve items into tracks concurrently and queue them in their original order
+        
+        Each time a leading run of items is ready it is queued as one batch,
+        so playback can start with the first batch when a client is given.
+        Raises JobCancelled, without queueing anything more, once the chat
+        is stopped.
+        """
+        total = len(items)
+        if not total:
+            return 0
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        generation = self.generations.get(chat_id, 0)
+        
+        def check_stopped():
+            if self.generations.get(chat_id, 0) != generation:
+                raise JobCancelled(f"Import into {chat_id} was stopped")
+        
+        async def resolve_at(index: int):
+            async with semaphore:
+                check_stopped()
+                try:
+                    return index, await resolve(items[index])
+                except JobCancelled:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Could not resolve entry {index}: {e}")
+                    return index, None
+        
+        results: Dict[int, Optional[Track]] = {}
+        next_index = 0
+        resolved = 0
+        added = 0
+        starter = None
+        tasks = [asyncio.create_task(resolve_at(i)) for i in range(total)]
+        
+        try:
+            for future in asyncio.as_completed(tasks):
+                index, track = await future
+                results[index] = track
+                resolved += 1
+                
+                # Queue the leading run of resolved entries, keeping their order
+                batch = []
+                while next_index in results:
+                    track = results.pop(next_index)
+                    if track:
+                        batch.append(track)
+                    next_index += 1
+                
+                if batch:
+                    # Checked right before submitting, so a batch never lands after /stop's clear
+                    check_stopped()
+                    await self.actors.submit(chat_id, self._enqueue_many, chat_id, batch)
+                    added += len(batch)
+                    if client and starter is None:
+                        starter = asyncio.create_task(self.play_if_idle(chat_id, client))
+                
+                if progress:
+                    try:
+                        await progress(resolved, total)
+                    except Exception as e:
+                        logger.warning(f"Progress update failed: {e}")
+        finally:
+            # Stopped or failed: the remaining entries are not wanted any more
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        
+        if starter:
+            await starter
+        return added
+    
+    async def _import_entry(self, entry: Dict[str, Any], requester: Requester) -> Optional[Track]:
+        """Turn one exported entry into a track, searching only when it has no URL"""
+        video = bool(entry.get('is_video', False))
+        url = entry.get('url') or ''
+        if url.startswith('http') and entry.get('title'):
+            # Exported entries already carry the page URL, formats resolve at play time
+            return Track(
+                title=entry['title'],
+                webpage_url=url,
+                duration=int(entry.get('duration') or 0),
+                requester=requester,
+                is_video=video
+            )
+        
+        query = url or entry.get('title')
+        if not query:
+            return None
+        track_info = await self.search_youtube(query, video)
+        return Track.from_info(track_info, requester, video) if track_info else None
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import bisect
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+class PlaybackClock:
+    """Tracks the playback position of a stream across pauses and speed changes"""
+    
+    __slots__ = ('offset', 'speed', 'started_at', 'paused_at')
+    
+    def __init__(self, offset: float = 0.0, speed: float = 1.0):
+        self.offset = offset
+        self.speed = speed
+        self.started_at = time.monotonic()
+        self.paused_at: Optional[float] = None
+    
+    def position(self) -> float:
+        """Get the current position in seconds of track time"""
+        now = self.paused_at if self.paused_at is not None else time.monotonic()
+        return self.offset + (now - self.started_at) * self.speed
+    
+    def pause(self):
+        """Freeze the clock"""
+        if self.paused_at is None:
+            self.paused_at = time.monotonic()
+    
+    def resume(self):
+        """Continue the clock, excluding the time spent paused"""
+        if self.paused_at is not None:
+            self.started_at += time.monotonic() - self.paused_at
+            self.paused_at = None
+    
+    @property
+    def paused(self) -> bool:
+        """Whether the clock is paused"""
+        return self.paused_at is not None
+    
+    def restart(self, offset: float, speed: float):
+        """Restart the clock from a new position, e.g. after a seek"""
+        paused = self.paused
+        self.offset = offset
+        self.speed = speed
+        self.started_at = time.monotonic()
+        self.paused_at = self.started_at if paused else None
+
+class KeyframeIndex:
+    """Cached keyframe timestamps of local video files, used to snap seeks"""
+    
+    def __init__(self, max_files: int = 32):
+        self.max_files = max_files
+        self.files: "OrderedDict[str, List[float]]" = OrderedDict()
+    
+    async def get(self, file_path: str) -> Optional[List[float]]:
+        """Get the sorted keyframe times of a file, probing it on first use"""
+        try:
+            key = f"{file_path}:{os.path.getmtime(file_path)}"
+        except OSError:
+            return None
+        
+        if key in self.files:
+            self.files.move_to_end(key)
+            return self.files[key]
+        
+        keyframes = await self._probe(file_path)
+        if keyframes:
+            self.files[key] = keyframes
+            while len(self.files) > self.max_files:
+                self.files.popitem(last=False)
+        return keyframes
+    
+    async def snap(self, file_path: str, position: float) -> Optional[float]:
+        """Get the last keyframe at or before a position, if the file is indexed"""
+        keyframes = await self.get(file_path)
+        if not keyframes:
+            return None
+        index = bisect.bisect_right(keyframes, position) - 1
+        return keyframes[max(0, index)]
+    
+    async def _probe(self, file_path: str) -> Optional[List[float]]:
+        """List keyframe packet times of the first video stream with ffprobe"""
+        try:
+            process = await asyncio.create_subprocess_exec(
+                'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+                '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0',
+                file_path,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL
+            )
+            stdout, _ = await process.communicate()
+        except Exception as e:
+            logger.error(f"Error indexing keyframes of {file_path}: {e}")
+            return None
+        
+        keyframes = set()
+        for line in stdout.decode(errors='ignore').splitlines():
+            pts_time, _, flags = line.partition(',')
+            if 'K' in flags:
+                try:
+                    keyframes.add(float(pts_time))
+                except ValueError:
+                    continue
+        return sorted(keyframes) or None
+
+def tempo_filters(speed: float) -> List[str]:
+    """Split a speed factor into atempo stages within ffmpeg's 0.5-2.0 range"""
+    filters = []
+    while speed > 2.0:
+        filters.append("atempo=2.0")
+        speed /= 2.0
+    while speed < 0.5:
+        filters.append("atempo=0.5")
+        speed /= 0.5
+    filters.append(f"atempo={speed:g}")
+    return filters
+
+def build_ffmpeg_parameters(offset: float = 0.0, exact: bool = True,
+                            speed: float = 1.0, video: bool = False) -> str:
+    """Build extra ffmpeg arguments that start a stream at an offset and speed
+    
+    The offset goes before the input so ffmpeg seeks in the container
+    index instead of decoding from zero. With exact=False it also skips
+    the accurate-seek decode, for offsets already snapped to a keyframe.
+    """
+    params = []
+    if offset > 0:
+        params.append(f"-ss {offset:.3f}")
+        if not exact:
+            params.append("-noaccurate_seek")
+    
+    if speed != 1.0:
+        params.append("-atend")
+        if video:
+            params.append(f"-filter:v setpts={1 / speed:g}*PTS")
+        params.append(f"-filter:a {','.join(tempo_filters(speed))}")
+    return ' '.join(params)
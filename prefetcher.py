@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import itertools
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, Set
+import aiohttp
+from config import Config
+from extractor import extraction_context, PRIORITY_PREFETCH
+
+logger = logging.getLogger(__name__)
+
+class Prefetcher:
+    """Per-chat background worker that prepares the next queue entries ahead of time"""
+    
+    def __init__(self, player, depth: int = Config.RESOLVE_LOOKAHEAD):
+        self.player = player
+        self.depth = depth
+        self.workers: Dict[int, asyncio.Task] = {}
+        self.wakeups: Dict[int, asyncio.Event] = {}
+        self.wake_at: Dict[int, float] = {}
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.checked_urls: Set[str] = set()
+        
+        # Prefetch statistics
+        self.ready = 0
+        self.validated = 0
+        self.invalid = 0
+        self.buffered = 0
+    
+    def notify(self, chat_id: int):
+        """Tell the chat's worker the queue changed, starting it if needed"""
+        event = self.wakeups.setdefault(chat_id, asyncio.Event())
+        event.set()
+        
+        worker = self.workers.get(chat_id)
+        if worker is None or worker.done():
+            # The worker inherits the context, so its resolutions and downloads run as prefetch work
+            with extraction_context(PRIORITY_PREFETCH, chat_id):
+                self.workers[chat_id] = asyncio.create_task(self._run(chat_id, event))
+    
+    def track_started(self, chat_id: int, track):
+        """Schedule a refresh of the next entries shortly before this track ends"""
+        duration = track.duration or 0
+        if duration > 0:
+            self.wake_at[chat_id] = time.monotonic() + max(0, duration - Config.STREAM_PREFETCH_LEAD)
+        else:
+            self.wake_at.pop(chat_id, None)
+        self.notify(chat_id)
+    
+    def cancel(self, chat_id: int):
+        """Stop prefetching for a chat"""
+        worker = self.workers.pop(chat_id, None)
+        if worker:
+            worker.cancel()
+        self.wakeups.pop(chat_id, None)
+        self.wake_at.pop(chat_id, None)
+    
+    async def _run(self, chat_id: int, event: asyncio.Event):
+        """Worker loop: prefetch on every queue change or scheduled wakeup"""
+        try:
+            while True:
+                timeout = Config.PREFETCH_IDLE_TIMEOUT
+                wake_at = self.wake_at.get(chat_id)
+                if wake_at is not None:
+                    timeout = max(0, wake_at - time.monotonic())
+                
+                try:
+                    await asyncio.wait_for(event.wait(), timeout)
+                except asyncio.TimeoutError:
+                    state = self.player.chats.get(chat_id)
+                    if wake_at is None and not (state and state.queue):
+                        # Idle with nothing queued, let the worker go
+                        break
+                    self.wake_at.pop(chat_id, None)
+                
+                event.clear()
+                await self._prefetch(chat_id)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Prefetcher error in {chat_id}: {e}")
+        finally:
+            if self.workers.get(chat_id) is asyncio.current_task():
+                del self.workers[chat_id]
+                self.wakeups.pop(chat_id, None)
+    
+    async def _prefetch(self, chat_id: int):
+        """Resolve, validate and optionally buffer the head of the queue"""
+        state = self.player.chats.get(chat_id)
+        if not state:
+            return
+        
+        for index, track in enumerate(list(itertools.islice(state.queue, self.depth + 1))):
+            if state.current is track:
+                # Already streaming, nothing to prepare
+                continue
+            
+            # Tracks belong to the chat's actor, so results are handed over through it
+            url = await self.player.get_stream_url(track, valid_for=Config.STREAM_PREFETCH_LEAD,
+                                                   chat_id=chat_id, store=False)
+            if not url:
+                continue
+            self.ready += 1
+            
+            if Config.PREFETCH_VALIDATE and url not in self.checked_urls and not await self._validate(url):
+                # The URL was rejected upstream, force a fresh resolution
+                self.invalid += 1
+                self.player.stream_cache.invalidate(track.webpage_url, track.is_video)
+                await self.player.set_track_url(chat_id, track, None)
+                url = await self.player.get_stream_url(track, chat_id=chat_id, store=False)
+                if not url:
+                    continue
+            if url != track.url:
+                await self.player.set_track_url(chat_id, track, url)
+            
+            if index == 1 and Config.PREFETCH_DOWNLOAD and not track.file_path:
+                file_path = await self.player.download_track(track, chat_id)
+                if file_path and await self.player.attach_file(chat_id, track, file_path):
+                    self.buffered += 1
+    
+    async def _validate(self, url: str) -> bool:
+        """Check a stream URL is still served by fetching its first byte"""
+        if os.path.exists(url):
+            return True
+        
+        try:
+            if self.session is None or self.session.closed:
+                self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+            async with self.session.get(url, headers={'Range': 'bytes=0-0'}) as response:
+                self.validated += 1
+                if response.status not in (200, 206):
+                    return False
+            
+            if len(self.checked_urls) >= 1000:
+                self.checked_urls.clear()
+            self.checked_urls.add(url)
+            return True
+        except Exception as e:
+            logger.warning(f"Stream validation failed: {e}")
+            # Network hiccups are not proof the URL is bad
+            return True
+    
+    async def close(self):
+        """Stop all workers and release the HTTP session"""
+        for chat_id in list(self.workers):
+            self.cancel(chat_id)
+        if self.session and not self.session.closed:
+            await self.session.close()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get prefetch statistics"""
+        return {
+            'workers': len(self.workers),
+            'ready': self.ready,
+            'validated': self.validated,
+            'invalid': self.invalid,
+            'buffered': self.buffered
+        }
@@ -36,6 +36,7 @@ logger = logging.getLogger(__name__)
 
 async def main():
     """Main function to run the bot"""
+    bot = None
     try:
         # Validate configuration
         logger.info("🔧 Validating configuration...")
@@ -75,6 +76,13 @@ async def main():
             monitor_task.cancel()
         except:
             pass
+        
+        # Save playback positions and flush buffered queue writes
+        if bot is not None:
+            try:
+                await bot.stop()
+            except Exception as e:
+                logger.error(f"Error stopping bot: {e}")
 
 def run_bot():
     """Run the bot with proper event loop handling"""
@@ -113,7 +121,7 @@ if __name__ == "__main__":
     print(f"   • API ID: {'✅ Set' if Config.API_ID != 0 else '❌ Not Set'}")
     print(f"   • API Hash: {'✅ Set' if Config.API_HASH != 'YOUR_API_HASH' else '❌ Not Set'}")
     print(f"   • Sudo Users: {len(Config.SUDO_USERS)} user(s)")
-    print(f"   • Assistant: {'✅ Enabled' if Config.SESSION_STRING else '❌ Disabled'}")
+    print(f"   • Assistants: {len(Config.SESSION_STRINGS)} account(s)" if Config.SESSION_STRINGS else "   • Assistant: ❌ Disabled")
     print(f"   • Database: {Config.DATABASE_URL}")
     print()
     
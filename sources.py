@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from config import Config
+from extractor import extractor, JobCancelled, SourceUnavailable
+
+logger = logging.getLogger(__name__)
+
+def source_for_url(url: str) -> str:
+    """Name the source a page URL belongs to, for its concurrency limit"""
+    return 'soundcloud' if 'soundcloud.com' in (url or '') else 'youtube'
+
+def download_source_for_url(url: str) -> str:
+    """Name the source downloads of a page URL run under, apart from searches and resolution"""
+    return f"{source_for_url(url)}_download"
+
+class SearchSource:
+    """One place tracks can be searched, with its recent latency and success record
+    
+    Searches run search_sync in the extraction pool, unless the source has
+    a search_async coroutine that can answer without a worker thread.
+    """
+    
+    def __init__(self, name: str, search_sync: Callable[[str, bool], Optional[Dict[str, Any]]],
+                 supports_video: bool = True, window: int = Config.SEARCH_STATS_WINDOW,
+                 search_async: Optional[Callable[[str, bool], Awaitable[Optional[Dict[str, Any]]]]] = None):
+        self.name = name
+        self.search_sync = search_sync
+        self.search_async = search_async
+        self.supports_video = supports_video
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window)
+        self.requests = 0
+        self.wins = 0
+    
+    async def search(self, query: str, video: bool) -> Optional[Dict[str, Any]]:
+        """Run a search, recording how it went"""
+        started = time.monotonic()
+        self.requests += 1
+        try:
+            if self.search_async:
+                result = await self.search_async(query, video)
+            else:
+                result = await extractor.run(self.search_sync, query, video, source=self.name)
+        except (JobCancelled, SourceUnavailable):
+            # Says nothing new about the source's health
+            return None
+        except Exception as e:
+            self.outcomes.append(False)
+            logger.warning(f"{self.name} search failed for '{query}': {e}")
+            return None
+        
+        self.latencies.append(time.monotonic() - started)
+        self.outcomes.append(result is not None)
+        return result
+    
+    def success_rate(self) -> float:
+        """Share of recent searches that returned a result"""
+        if not self.outcomes:
+            return 1.0
+        return sum(self.outcomes) / len(self.outcomes)
+    
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Get a percentile of recent successful latencies, or None without enough samples"""
+        if len(self.latencies) < Config.SEARCH_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile))]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get latency and success statistics"""
+        p50 = self.latency_percentile(0.5)
+        p90 = self.latency_percentile(0.9)
+        return {
+            'requests': self.requests,
+            'wins': self.wins,
+            'success_rate': round(self.success_rate() * 100, 1),
+            'p50_ms': round(p50 * 1000) if p50 is not None else None,
+            'p90_ms': round(p90 * 1000) if p90 is not None else None
+        }
+
+class HedgedSearch:
+    """Searches the primary source and hedges with alternates when it is slow
+    
+    The primary gets a head start equal to its recent latency percentile,
+    so a hedge only fires when it is slower than it usually is. A primary
+    that keeps failing is hedged straight away. The first acceptable result
+    wins; once it is returned, slower searches are left to finish so their
+    timings still count. If the caller is cancelled first, every search
+    still running is cancelled with it.
+    """
+    
+    def __init__(self, sources: List[SearchSource], percentile: float = Config.SEARCH_HEDGE_PERCENTILE):
+        self.sources = sources
+        self.percentile = percentile
+        self.searches = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+    
+    def hedge_delay(self, source: SearchSource) -> float:
+        """How long to wait on a source before hedging"""
+        if source.success_rate() < 0.5:
+            return 0.0
+        latency = source.latency_percentile(self.percentile)
+        if latency is None:
+            return Config.SEARCH_HEDGE_DELAY
+        return min(max(latency, Config.SEARCH_HEDGE_MIN_DELAY), Config.SEARCH_HEDGE_MAX_DELAY)
+    
+    @staticmethod
+    def acceptable(result: Optional[Dict[str, Any]]) -> bool:
+        """Whether a result can be queued"""
+        return bool(result and result.get('webpage_url'))
+    
+    async def search(self, query: str, video: bool = False) -> Optional[Dict[str, Any]]:
+        """Get the first acceptable result from the primary or a hedged alternate"""
+        sources = [source for source in self.sources if source.supports_video or not video]
+        if not sources:
+            return None
+        
+        self.searches += 1
+        primary, alternates = sources[0], sources[1:]
+        pending = {asyncio.create_task(primary.search(query, video)): primary}
+        
+        try:
+            delay = self.hedge_delay(primary)
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done:
+                task = done.pop()
+                del pending[task]
+                result = task.result()
+                if self.acceptable(result) or not alternates:
+                    primary.wins += self.acceptable(result)
+                    return result
+            
+            if alternates:
+                self.hedged += 1
+                logger.info(f"Hedging search for '{query}' after {delay:.1f}s on {primary.name}")
+                for source in alternates:
+                    pending[asyncio.create_task(source.search(query, video))] = source
+            
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    source = pending.pop(task)
+                    result = task.result()
+                    if self.acceptable(result):
+                        source.wins += 1
+                        if source is not primary:
+                            self.hedge_wins += 1
+                        return result
+            return None
+        except BaseException:
+            # The caller went away, don't keep its searches holding extraction slots
+            for task in pending:
+                task.cancel()
+            raise
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hedging statistics"""
+        return {
+            'searches': self.searches,
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins,
+            'hedge_delay_ms': round(self.hedge_delay(self.sources[0]) * 1000) if self.sources else None,
+            'sources': {source.name: source.get_stats() for source in self.sources}
+        }
+
+if __name__ == "__main__":
+    import random
+    
+    # Simulate a primary that is usually fast but sometimes stalls
+    def make_search(name: str, base: float, stall_rate: float):
+        def search_sync(query: str, video: bool):
+            time.sleep(base * 10 if random.random() < stall_rate else base * random.uniform(0.8, 1.2))
+            return {'title': f"{query} ({name})", 'webpage_url': f"https://{name}/{query}"}
+        return search_sync
+    
+    async def test_hedging():
+        random.seed(1)
+        youtube = SearchSource("youtube", make_search("youtube", 0.1, 0.08))
+        soundcloud = SearchSource("soundcloud", make_search("soundcloud", 0.15, 0.0), supports_video=False)
+        hedged = HedgedSearch([youtube, soundcloud])
+        
+        for label, searcher in [("unhedged", HedgedSearch([SearchSource("youtube", youtube.search_sync)])),
+                                ("hedged", hedged)]:
+            latencies = []
+            for i in range(100):
+                started = time.monotonic()
+                await searcher.search(f"song {i}")
+                latencies.append(time.monotonic() - started)
+            latencies.sort()
+            print(f"{label:9} p50 {latencies[50] * 1000:4.0f} ms, p95 {latencies[95] * 1000:4.0f} ms, "
+                  f"max {latencies[-1] * 1000:4.0f} ms")
+        print(hedged.get_stats())
+        extractor.shutdown()
+    
+    asyncio.run(test_hedging())
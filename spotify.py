@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import base64
+import logging
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import aiohttp
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SPOTIFY_URL_RE = re.compile(
+    r'(?:https?://open\.spotify\.com/(?:intl-[\w-]+/)?|spotify:)(track|album|playlist)[/:]([A-Za-z0-9]+)'
+)
+YOUTUBE_ID_RE = re.compile(r'(?:[?&]v=|youtu\.be/)([\w-]{11})')
+
+def parse_spotify_url(url: str) -> Optional[Tuple[str, str]]:
+    """Split a Spotify link into its kind (track/album/playlist) and ID"""
+    match = SPOTIFY_URL_RE.search(url)
+    return (match.group(1), match.group(2)) if match else None
+
+def youtube_video_id(url: str) -> Optional[str]:
+    """Extract the video ID from a YouTube watch URL"""
+    match = YOUTUBE_ID_RE.search(url or '')
+    return match.group(1) if match else None
+
+class SpotifyClient:
+    """Minimal Spotify Web API client for turning links into track metadata"""
+    
+    def __init__(self, client_id: str = Config.SPOTIFY_CLIENT_ID,
+                 client_secret: str = Config.SPOTIFY_CLIENT_SECRET,
+                 api_url: str = Config.SPOTIFY_API_URL,
+                 auth_url: str = Config.SPOTIFY_AUTH_URL):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.api_url = api_url.rstrip('/')
+        self.auth_url = auth_url
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.token: Optional[str] = None
+        self.token_expires = 0.0
+        self._token_lock = asyncio.Lock()
+        
+        # Request statistics
+        self.requests = 0
+        self.token_refreshes = 0
+    
+    @property
+    def enabled(self) -> bool:
+        """Whether credentials are configured"""
+        return bool(self.client_id and self.client_secret)
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Get the shared HTTP session, creating it on first use"""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=15))
+        return self.session
+    
+    async def _get_token(self, force: bool = False) -> str:
+        """Get a client-credentials access token, reusing it until shortly before it expires"""
+        async with self._token_lock:
+            if not force and self.token and time.monotonic() < self.token_expires - 60:
+                return self.token
+            
+            credentials = base64.b64encode(f"{self.client_id}:{self.client_secret}".encode()).decode()
+            async with self._get_session().post(
+                self.auth_url, data={'grant_type': 'client_credentials'},
+                headers={'Authorization': f"Basic {credentials}"}
+            ) as response:
+                response.raise_for_status()
+                data = await response.json()
+            
+            self.token = data['access_token']
+            self.token_expires = time.monotonic() + data.get('expires_in', 3600)
+            self.token_refreshes += 1
+            return self.token
+    
+    async def _get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """GET an API path, refreshing the token or backing off once when told to"""
+        url = path if path.startswith('http') else f"{self.api_url}{path}"
+        force_token = False
+        
+        for attempt in range(3):
+            token = await self._get_token(force=force_token)
+            self.requests += 1
+            async with self._get_session().get(
+                url, params=params, headers={'Authorization': f"Bearer {token}"}
+            ) as response:
+                if response.status == 401:
+                    force_token = True
+                    continue
+                if response.status == 429:
+                    retry_after = float(response.headers.get('Retry-After', 1))
+                    await asyncio.sleep(min(retry_after, 10))
+                    continue
+                response.raise_for_status()
+                return await response.json()
+        
+        raise RuntimeError(f"Spotify request failed: {path}")
+    
+    @staticmethod
+    def _track_info(track: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Reduce a Spotify track object to what matching needs"""
+        if not track or not track.get('id'):
+            # Local files and removed tracks have no ID
+            return None
+        return {
+            'id': track['id'],
+            'name': track.get('name', ''),
+            'artists': [artist.get('name', '') for artist in track.get('artists') or []],
+            'duration': int((track.get('duration_ms') or 0) / 1000)
+        }
+    
+    async def get_tracks(self, track_ids: List[str]) -> List[Dict[str, Any]]:
+        """Look up tracks in batches of 50 IDs per request"""
+        tracks = []
+        for start in range(0, len(track_ids), 50):
+            data = await self._get('/v1/tracks', {'ids': ','.join(track_ids[start:start + 50])})
+            tracks.extend(filter(None, map(self._track_info, data.get('tracks') or [])))
+        return tracks
+    
+    async def _get_paged(self, path: str, params: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
+        """Follow a paging object's next links until exhausted or the limit is reached"""
+        items = []
+        data = await self._get(path, params)
+        while True:
+            items.extend(data.get('items') or [])
+            if len(items) >= limit or not data.get('next'):
+                return items[:limit]
+            data = await self._get(data['next'])
+    
+    async def get_album_tracks(self, album_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Get an album's tracks"""
+        items = await self._get_paged(f"/v1/albums/{album_id}/tracks", {'limit': 50}, limit)
+        return list(filter(None, map(self._track_info, items)))
+    
+    async def get_playlist_tracks(self, playlist_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Get a playlist's tracks"""
+        items = await self._get_paged(f"/v1/playlists/{playlist_id}/tracks", {
+            'limit': 100,
+            'fields': 'items(track(id,name,duration_ms,artists(name))),next'
+        }, limit)
+        return list(filter(None, (self._track_info(item.get('track')) for item in items)))
+    
+    async def resolve(self, url: str, limit: int = Config.MAX_QUEUE_SIZE) -> List[Dict[str, Any]]:
+        """Get track metadata for a Spotify track, album or playlist link"""
+        parsed = parse_spotify_url(url)
+        if not parsed:
+            return []
+        
+        kind, item_id = parsed
+        if kind == 'track':
+            return await self.get_tracks([item_id])
+        if kind == 'album':
+            return await self.get_album_tracks(item_id, limit)
+        return await self.get_playlist_tracks(item_id, limit)
+    
+    async def close(self):
+        """Release the HTTP session"""
+        if self.session and not self.session.closed:
+            await self.session.close()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get request statistics"""
+        return {
+            'enabled': self.enabled,
+            'requests': self.requests,
+            'token_refreshes': self.token_refreshes
+        }
+
+if __name__ == "__main__":
+    from aiohttp import web
+    
+    # Exercise the client against a local stub of the Spotify API
+    async def test_spotify():
+        counts = {'token': 0, 'tracks': 0}
+        
+        def make_track(i):
+            return {'id': f"t{i}", 'name': f"Song {i}", 'duration_ms': 200000, 'artists': [{'name': 'Artist'}]}
+        
+        async def token(request):
+            counts['token'] += 1
+            return web.json_response({'access_token': 'stub', 'expires_in': 3600})
+        
+        async def tracks(request):
+            counts['tracks'] += 1
+            ids = request.query['ids'].split(',')
+            return web.json_response({'tracks': [make_track(i[1:]) for i in ids]})
+        
+        async def album(request):
+            offset = int(request.query.get('offset', 0))
+            nxt = f"{base}/v1/albums/a1/tracks?offset={offset + 50}" if offset + 50 < 120 else None
+            items = [make_track(i) for i in range(offset, min(offset + 50, 120))]
+            return web.json_response({'items': items, 'next': nxt})
+        
+        async def playlist(request):
+            return web.json_response({'items': [{'track': make_track(1)}, {'track': None}], 'next': None})
+        
+        app = web.Application()
+        app.router.add_post('/api/token', token)
+        app.router.add_get('/v1/tracks', tracks)
+        app.router.add_get('/v1/albums/{id}/tracks', album)
+        app.router.add_get('/v1/playlists/{id}/tracks', playlist)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        base = f"http://127.0.0.1:{port}"
+        
+        client = SpotifyClient('id', 'secret', api_url=base, auth_url=f"{base}/api/token")
+        print(await client.resolve("https://open.spotify.com/track/t7?si=x"))
+        print(len(await client.resolve("spotify:album:a1")), "album tracks")
+        print(len(await client.resolve("https://open.spotify.com/album/a1", limit=60)), "album tracks (limited)")
+        print(await client.resolve("https://open.spotify.com/playlist/p1"))
+        print(len(await client.get_tracks([f"t{i}" for i in range(120)])), "tracks in", counts['tracks'] - 1, "requests")
+        print("token requests:", counts['token'], client.get_stats())
+        
+        await client.close()
+        await runner.cleanup()
+    
+    asyncio.run(test_spotify())
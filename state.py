@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import sys
+import weakref
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+from playback import PlaybackClock
+
+class Requester:
+    """A user who queued tracks, shared by every track they requested"""
+    
+    __slots__ = ('id', 'first_name', 'username', '__weakref__')
+    
+    _interned: "weakref.WeakValueDictionary[int, Requester]" = weakref.WeakValueDictionary()
+    
+    def __init__(self, user_id: int, first_name: str, username: Optional[str] = None):
+        self.id = user_id
+        self.first_name = first_name
+        self.username = username
+    
+    @classmethod
+    def get(cls, user_id: int, first_name: str, username: Optional[str] = None) -> "Requester":
+        """Get the shared record for a user, refreshing their names"""
+        requester = cls._interned.get(user_id)
+        if requester is None:
+            requester = cls(user_id, first_name, username)
+            cls._interned[user_id] = requester
+        else:
+            requester.first_name = first_name
+            requester.username = username
+        return requester
+    
+    @classmethod
+    def from_user(cls, user) -> "Requester":
+        """Get the shared record for a pyrogram user"""
+        return cls.get(user.id, user.first_name, user.username)
+
+class Track:
+    """A queued track"""
+    
+    __slots__ = ('title', 'webpage_url', 'duration', 'is_video', 'requester',
+                 'thumbnail', 'uploader', 'url', 'file_path')
+    
+    def __init__(self, title: str, webpage_url: str, duration: int, requester: Requester,
+                 is_video: bool = False, thumbnail: Optional[str] = None,
+                 uploader: Optional[str] = None, url: Optional[str] = None,
+                 file_path: Optional[str] = None):
+        self.title = title
+        self.webpage_url = webpage_url
+        self.duration = duration
+        self.is_video = is_video
+        self.requester = requester
+        self.thumbnail = thumbnail
+        self.uploader = sys.intern(uploader) if uploader else None
+        self.url = url
+        self.file_path = file_path
+    
+    @classmethod
+    def from_info(cls, info: Dict[str, Any], requester: Requester, video: bool = False) -> "Track":
+        """Build a track from search result info"""
+        return cls(
+            title=info['title'],
+            webpage_url=info['webpage_url'],
+            duration=info['duration'],
+            requester=requester,
+            is_video=video,
+            thumbnail=info.get('thumbnail'),
+            uploader=info.get('uploader'),
+            url=info.get('url')
+        )
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the track as a plain dict"""
+        return {
+            'title': self.title,
+            'url': self.webpage_url,
+            'duration': self.duration,
+            'requester': self.requester.first_name,
+            'is_video': self.is_video
+        }
+
+class ChatState:
+    """Everything the player keeps for one chat"""
+    
+    __slots__ = ('queue', 'current', 'loop_enabled', 'loop_count', 'speed', 'volume',
+                 'clock', 'speed_change', 'stream_id')
+    
+    def __init__(self):
+        self.queue: Deque[Track] = deque()
+        self.current: Optional[Track] = None
+        self.loop_enabled = False
+        self.loop_count = 1
+        self.speed = 1.0
+        self.volume = 100
+        self.clock: Optional[PlaybackClock] = None
+        self.speed_change: Optional[asyncio.Task] = None
+        self.stream_id = 0  # bumped each time a stream starts, to tell which one an end event is for
+
+if __name__ == "__main__":
+    import tracemalloc
+    
+    count = 10000
+    users = [(1000 + i, f"User {i}", f"user{i}") for i in range(25)]
+    
+    # Strings are built up front so only the per-track records are measured
+    titles = [f"Track number {i}" for i in range(count)]
+    urls = [f"https://www.youtube.com/watch?v={i:011d}" for i in range(count)]
+    uploaders = [f"Channel {i % 50}" for i in range(count)]
+    
+    def measure(build):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        queue = build()
+        used = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        return queue, used
+    
+    def build_dicts():
+        queue = []
+        for i in range(count):
+            user_id, first_name, username = users[i % len(users)]
+            queue.append({
+                'title': titles[i],
+                'url': None,
+                'webpage_url': urls[i],
+                'duration': 180 + i % 120,
+                'thumbnail': None,
+                'uploader': uploaders[i],
+                'requester': {
+                    'id': user_id,
+                    'first_name': first_name,
+                    'username': username
+                },
+                'is_video': False
+            })
+        return queue
+    
+    def build_tracks():
+        queue = deque()
+        for i in range(count):
+            user_id, first_name, username = users[i % len(users)]
+            queue.append(Track(
+                title=titles[i],
+                webpage_url=urls[i],
+                duration=180 + i % 120,
+                requester=Requester.get(user_id, first_name, username),
+                uploader=uploaders[i]
+            ))
+        return queue
+    
+    dicts, dict_bytes = measure(build_dicts)
+    tracks, track_bytes = measure(build_tracks)
+    
+    print(f"{count} queued tracks, excluding shared strings")
+    print(f"  dict tracks:    {dict_bytes / 1024:8.0f} KiB ({dict_bytes / count:.0f} B/track)")
+    print(f"  slotted tracks: {track_bytes / 1024:8.0f} KiB ({track_bytes / count:.0f} B/track)")
+    print(f"  ratio:          {dict_bytes / track_bytes:.1f}x")
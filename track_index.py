@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+from typing import Any, Dict, Iterable, Optional, Set
+from config import Config
+from cache import normalize_query
+from spotify import youtube_video_id
+
+logger = logging.getLogger(__name__)
+
+# Words that appear in many titles and say nothing about which song it is
+NOISE_WORDS = frozenset({
+    'official', 'video', 'music', 'audio', 'lyrics', 'lyric', 'visualizer',
+    'hd', 'hq', '4k', 'mv', 'ft', 'feat'
+})
+
+def trigrams(text: str, exclude: Iterable[str] = ()) -> Set[str]:
+    """Split text into word trigrams, padded so word starts and ends count"""
+    grams = set()
+    skip = NOISE_WORDS.union(exclude)
+    for word in normalize_query(text).split():
+        if word in skip:
+            continue
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+class TrackIndex:
+    """Fuzzy index over titles and uploaders of played tracks, stored in SQLite"""
+    
+    def __init__(self, db, min_score: float = Config.TRACK_INDEX_MIN_SCORE,
+                 min_similarity: float = Config.TRACK_INDEX_MIN_SIMILARITY,
+                 candidates: int = Config.TRACK_INDEX_CANDIDATES):
+        self.db = db
+        self.min_score = min_score
+        self.min_similarity = min_similarity
+        self.candidates = candidates
+        self.hits = 0
+        self.misses = 0
+        self.indexed = 0
+    
+    async def add(self, track) -> bool:
+        """Index a track as it starts playing, or bump its play count"""
+        if not youtube_video_id(track.webpage_url):
+            # Hits stand in for YouTube searches, so uploads and other sources are left out
+            return False
+        try:
+            grams = trigrams(f"{track.title} {track.uploader or ''}")
+            if not grams:
+                return False
+            await self.db.index_track({
+                'webpage_url': track.webpage_url,
+                'title': track.title,
+                'uploader': track.uploader,
+                'duration': track.duration,
+                'thumbnail': track.thumbnail
+            }, grams)
+            self.indexed += 1
+            return True
+        except Exception as e:
+            logger.error(f"Error indexing track: {e}")
+            return False
+    
+    async def search(self, query: str, video: bool = False) -> Optional[Dict[str, Any]]:
+        """Get the best indexed match for a query, or None if nothing is confident enough
+        
+        A candidate must contain most of the query's trigrams (coverage), be
+        close to the query as a whole (Dice over both sets), and the query
+        must name the song and not just the artist: it has to cover half of
+        the title's trigrams left after the uploader's words are removed.
+        A miss only costs a normal search, so ties and doubt go that way.
+        """
+        grams = trigrams(query)
+        if len(grams) < 10:
+            # Too short to tell songs apart
+            self.misses += 1
+            return None
+        
+        try:
+            rows = await self.db.search_track_index(list(grams), self.candidates)
+        except Exception as e:
+            logger.error(f"Error searching track index: {e}")
+            return None
+        
+        best = None
+        best_rank = None
+        for row in rows:
+            if not youtube_video_id(row['webpage_url']):
+                # Indexed before only YouTube tracks were kept
+                continue
+            
+            uploader = row['uploader'] or ''
+            track_grams = trigrams(f"{row['title']} {uploader}")
+            name_grams = trigrams(row['title'], exclude=normalize_query(uploader).split()) or track_grams
+            shared = len(grams & track_grams)
+            
+            coverage = shared / len(grams)
+            dice = 2 * shared / (len(grams) + len(track_grams))
+            named = len(grams & name_grams) / len(name_grams)
+            if coverage < self.min_score or dice < self.min_similarity or named < 0.5:
+                continue
+            
+            rank = (round(coverage, 3), dice, row['plays'])
+            if best_rank is None or rank > best_rank:
+                best, best_rank = row, rank
+        
+        if best is None:
+            self.misses += 1
+            return None
+        
+        self.hits += 1
+        logger.info(f"Track index matched '{query}' to '{best['title']}' ({best_rank[0]:.2f})")
+        return {
+            'title': best['title'],
+            'url': None,
+            'webpage_url': best['webpage_url'],
+            'duration': best['duration'] or 0,
+            'thumbnail': best['thumbnail'],
+            'uploader': best['uploader'] or 'Unknown',
+            'view_count': 0,
+            'is_video': video
+        }
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get index hit/miss statistics"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups * 100, 1) if lookups else 0.0,
+            'indexed': self.indexed
+        }
+
+if __name__ == "__main__":
+    import asyncio
+    import os
+    import tempfile
+    from database import Database
+    from state import Requester, Track
+    
+    async def test_index():
+        db = Database(os.path.join(tempfile.mkdtemp(), "index.db"))
+        await db.init_db()
+        index = TrackIndex(db)
+        requester = Requester.get(1, "Test")
+        
+        played = [
+            ("Ed Sheeran - Shape of You (Official Music Video)", "Ed Sheeran"),
+            ("Ed Sheeran - Perfect (Official Music Video)", "Ed Sheeran"),
+            ("The Weeknd - Blinding Lights (Official Video)", "The Weeknd"),
+            ("Imagine Dragons - Believer", "Imagine Dragons"),
+            ("Shape of My Heart", "Sting"),
+            ("Queen - Bohemian Rhapsody (Official Video Remastered)", "Queen Official"),
+        ]
+        for i, (title, uploader) in enumerate(played):
+            await index.add(Track(title, f"https://www.youtube.com/watch?v=video{i:06d}", 200, requester,
+                                  uploader=uploader))
+        # Not a YouTube video, so a search must not be answered with it
+        await index.add(Track("Daft Punk - Get Lucky (Radio Edit)", "https://soundcloud.com/daftpunk/get-lucky",
+                              248, requester, uploader="Daft Punk"))
+        
+        # The last two lines should all miss: too short, artist only, noise only, a different recording,
+        # or not on YouTube
+        for query in ["shape of you", "shap of yu ed sheeran", "perfect ed sheeran", "beliver imagine dragons",
+                      "shape of my heart sting", "bohemian rhapsody",
+                      "you", "perfect", "ed sheeran", "official video", "bohemian rhapsody cover",
+                      "get lucky daft punk"]:
+            result = await index.search(query)
+            print(f"{query!r:28} -> {result['title'] if result else None}")
+        print(index.get_stats())
+    
+    asyncio.run(test_index())
@@ -5,72 +5,39 @@ import os
 import re
 import asyncio
 import logging
-import yt_dlp
 from typing import Optional, Tuple, Dict, Any
 from config import Config
+from extractor import extractor, SingleFlight, cancel_hook
+from ydl_pool import ydl_pool
+from sources import download_source_for_url
+from cache import normalize_query
 import time
 import psutil
 
 logger = logging.getLogger(__name__)
 
+# Coalesce concurrent /song requests for the same query or video
+_song_flights = SingleFlight("song")
+_song_download_flights = SingleFlight("song_download")
+
+# Number of requests still using each downloaded file
+_file_users: Dict[str, int] = {}
+
 async def get_file_from_youtube(query: str) -> Tuple[Optional[str], Optional[str], str, int]:
     """Download audio and video from YouTube"""
     try:
         # Create downloads directory if not exists
         os.makedirs(Config.DOWNLOADS_PATH, exist_ok=True)
         
-        # Search and get info
-        with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-            search_results = ydl.extract_info(
-                f"ytsearch:{query}",
-                download=False
-            )
-            
-            if not search_results or not search_results.get('entries'):
-                return None, None, "Not Found", 0
-            
-            video_info = search_results['entries'][0]
-            title = sanitize_filename(video_info.get('title', 'Unknown'))
-            duration = video_info.get('duration', 0)
-            url = video_info.get('webpage_url')
-        
-        # Download audio
-        audio_file = None
-        try:
-            audio_opts = Config.YTDL_OPTS.copy()
-            audio_opts['outtmpl'] = os.path.join(Config.DOWNLOADS_PATH, f"{title}_audio.%(ext)s")
-            
-            with yt_dlp.YoutubeDL(audio_opts) as ydl:
-                ydl.download([url])
-            
-            # Find the downloaded audio file
-            for ext in ['.mp3', '.m4a', '.webm', '.ogg']:
-                audio_path = os.path.join(Config.DOWNLOADS_PATH, f"{title}_audio{ext}")
-                if os.path.exists(audio_path):
-                    audio_file = audio_path
-                    break
-                    
-        except Exception as e:
-            logger.error(f"Audio download error: {e}")
+        audio_file, video_file, title, duration = await _song_flights.do(
+            normalize_query(query),
+            lambda: _fetch_song_files(query)
+        )
         
-        # Download video
-        video_file = None
-        try:
-            video_opts = Config.YTDL_VIDEO_OPTS.copy()
-            video_opts['outtmpl'] = os.path.join(Config.DOWNLOADS_PATH, f"{title}_video.%(ext)s")
-            
-            with yt_dlp.YoutubeDL(video_opts) as ydl:
-                ydl.download([url])
-            
-            # Find the downloaded video file
-            for ext in ['.mp4', '.webm', '.mkv']:
-                video_path = os.path.join(Config.DOWNLOADS_PATH, f"{title}_video{ext}")
-                if os.path.exists(video_path):
-                    video_file = video_path
-                    break
-                    
-        except Exception as e:
-            logger.error(f"Video download error: {e}")
+        # Callers release their files with release_downloaded_file
+        for file_path in (audio_file, video_file):
+            if file_path:
+                acquire_downloaded_file(file_path)
         
         return audio_file, video_file, title, duration
         
@@ -78,6 +45,91 @@ async def get_file_from_youtube(query: str) -> Tuple[Optional[str], Optional[str
         logger.error(f"YouTube download error: {e}")
         return None, None, "Error", 0
 
+async def _fetch_song_files(query: str) -> Tuple[Optional[str], Optional[str], str, int]:
+    """Search for a song and download its audio and video renditions"""
+    # Search and get info
+    video_info = await extractor.run(_search_first_result, query)
+    if not video_info:
+        return None, None, "Not Found", 0
+    
+    title = sanitize_filename(video_info.get('title', 'Unknown'))
+    duration = video_info.get('duration', 0)
+    url = video_info.get('webpage_url')
+    
+    # Download audio and video concurrently in the extraction pool
+    audio_file, video_file = await asyncio.gather(
+        _download_youtube_file(url, title, 'audio'),
+        _download_youtube_file(url, title, 'video')
+    )
+    
+    return audio_file, video_file, title, duration
+
+def acquire_downloaded_file(file_path: str):
+    """Count another user of a downloaded file, each must call release_downloaded_file"""
+    _file_users[file_path] = _file_users.get(file_path, 0) + 1
+
+def release_downloaded_file(file_path: str):
+    """Delete a downloaded file once no other request is still using it"""
+    users = _file_users.get(file_path, 1) - 1
+    if users > 0:
+        _file_users[file_path] = users
+        return
+    
+    _file_users.pop(file_path, None)
+    try:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    except Exception as e:
+        logger.error(f"Error removing file {file_path}: {e}")
+
+def _search_first_result(query: str) -> Optional[Dict[str, Any]]:
+    """Blocking YouTube search returning the first entry"""
+    with ydl_pool.get({'quiet': True}) as ydl:
+        search_results = ydl.extract_info(
+            f"ytsearch:{query}",
+            download=False
+        )
+        
+        if not search_results or not search_results.get('entries'):
+            return None
+        
+        return search_results['entries'][0]
+
+async def _download_youtube_file(url: str, title: str, kind: str) -> Optional[str]:
+    """Download the audio or video rendition of a YouTube URL"""
+    try:
+        return await _song_download_flights.do(
+            (url, kind),
+            lambda: extractor.run(_download_youtube_file_sync, url, title, kind,
+                                  source=download_source_for_url(url), timeout=Config.DOWNLOAD_TIMEOUT)
+        )
+    except Exception as e:
+        logger.error(f"{kind.capitalize()} download error: {e}")
+        return None
+
+def _download_youtube_file_sync(url: str, title: str, kind: str) -> Optional[str]:
+    """Blocking download of one rendition, run inside the extraction pool"""
+    if kind == 'video':
+        opts = Config.YTDL_VIDEO_OPTS.copy()
+        extensions = ['.mp4', '.webm', '.mkv']
+    else:
+        opts = Config.YTDL_OPTS.copy()
+        extensions = ['.mp3', '.m4a', '.webm', '.ogg']
+    
+    opts['progress_hooks'] = [cancel_hook]
+    outtmpl = os.path.join(Config.DOWNLOADS_PATH, f"{title}_{kind}.%(ext)s")
+    
+    with ydl_pool.get(opts, outtmpl=outtmpl) as ydl:
+        ydl.download([url])
+    
+    # Find the downloaded file
+    for ext in extensions:
+        file_path = os.path.join(Config.DOWNLOADS_PATH, f"{title}_{kind}{ext}")
+        if os.path.exists(file_path):
+            return file_path
+    
+    return None
+
 def sanitize_filename(filename: str) -> str:
     """Sanitize filename for safe file operations"""
     # Remove or replace invalid characters
@@ -121,23 +173,27 @@ def format_file_size(size_bytes: int) -> str:
 async def get_youtube_info(url: str) -> Optional[Dict[str, Any]]:
     """Get YouTube video information without downloading"""
     try:
-        with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-            info = ydl.extract_info(url, download=False)
-            
-            return {
-                'title': info.get('title'),
-                'duration': info.get('duration', 0),
-                'thumbnail': info.get('thumbnail'),
-                'uploader': info.get('uploader'),
-                'view_count': info.get('view_count', 0),
-                'upload_date': info.get('upload_date'),
-                'description': info.get('description', '')[:200] + '...' if info.get('description') else '',
-                'url': info.get('webpage_url')
-            }
+        info = await extractor.run(_extract_info, url)
+        
+        return {
+            'title': info.get('title'),
+            'duration': info.get('duration', 0),
+            'thumbnail': info.get('thumbnail'),
+            'uploader': info.get('uploader'),
+            'view_count': info.get('view_count', 0),
+            'upload_date': info.get('upload_date'),
+            'description': info.get('description', '')[:200] + '...' if info.get('description') else '',
+            'url': info.get('webpage_url')
+        }
     except Exception as e:
         logger.error(f"Error getting YouTube info: {e}")
         return None
 
+def _extract_info(url: str) -> Dict[str, Any]:
+    """Blocking metadata extraction for a single URL"""
+    with ydl_pool.get({'quiet': True}) as ydl:
+        return ydl.extract_info(url, download=False)
+
 def is_youtube_url(url: str) -> bool:
     """Check if URL is a valid YouTube URL"""
     youtube_patterns = [
@@ -149,6 +205,10 @@ def is_youtube_url(url: str) -> bool:
     
     return any(re.match(pattern, url) for pattern in youtube_patterns)
 
+def is_youtube_playlist(url: str) -> bool:
+    """Check if URL is a YouTube playlist"""
+    return bool(re.match(r'https?://(?:www\.|m\.|music\.)?youtube\.com/playlist\?(?:.*&)?list=[\w-]+', url))
+
 def is_spotify_url(url: str) -> bool:
     """Check if URL is a valid Spotify URL"""
     spotify_patterns = [
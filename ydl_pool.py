@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Hashable, Iterator
+import yt_dlp
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+def _freeze(value: Any) -> Hashable:
+    """Turn an options value into something hashable, for use as a pool key"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+class _PooledYoutubeDL:
+    """A YoutubeDL instance and how many jobs it has served"""
+    
+    __slots__ = ('ydl', 'uses')
+    
+    def __init__(self, ydl: yt_dlp.YoutubeDL):
+        self.ydl = ydl
+        self.uses = 0
+
+class YoutubeDLPool:
+    """Reusable YoutubeDL instances keyed by their options
+    
+    Building a YoutubeDL sets up its extractor registry, cookie jar and
+    HTTP handlers; keeping instances between jobs skips that, and lets
+    extractors and connections be reused. An instance serves one job at a
+    time and is closed after max_uses jobs, or after a job that raised,
+    so per-instance state cannot grow without bound.
+    """
+    
+    def __init__(self, max_idle: int = Config.YTDL_POOL_IDLE, max_uses: int = Config.YTDL_POOL_MAX_USES):
+        self.max_idle = max_idle
+        self.max_uses = max_uses
+        self.idle: Dict[Hashable, Deque[_PooledYoutubeDL]] = {}
+        self._lock = threading.Lock()
+        
+        # Pool counters
+        self.created = 0
+        self.reused = 0
+        self.recycled = 0
+    
+    def _create(self, opts: Dict[str, Any]) -> _PooledYoutubeDL:
+        """Build a new instance"""
+        with self._lock:
+            self.created += 1
+        # YoutubeDL keeps and normalizes the dict it is given
+        return _PooledYoutubeDL(yt_dlp.YoutubeDL(dict(opts)))
+    
+    def warm(self, opts: Dict[str, Any], count: int = 1):
+        """Build idle instances ahead of the first jobs that need them"""
+        key = _freeze(opts)
+        instances = [self._create(opts) for _ in range(count)]
+        with self._lock:
+            idle = self.idle.setdefault(key, deque())
+            room = max(0, self.max_idle - len(idle))
+            idle.extend(instances[:room])
+        for instance in instances[room:]:
+            self._close(instance)
+    
+    @contextmanager
+    def get(self, opts: Dict[str, Any], **overrides) -> Iterator[yt_dlp.YoutubeDL]:
+        """Check out an instance for opts, with per-job overrides such as outtmpl
+        
+        Overrides are set on the instance for this job only, so jobs that
+        differ just in their output template or playlist range still share
+        instances.
+        """
+        key = _freeze(opts)
+        with self._lock:
+            idle = self.idle.get(key)
+            instance = idle.pop() if idle else None
+            if instance is not None:
+                self.reused += 1
+        if instance is None:
+            instance = self._create(opts)
+        
+        params = instance.ydl.params
+        saved = {}
+        for name, value in overrides.items():
+            saved[name] = params.get(name, _MISSING)
+            if name == 'outtmpl':
+                value = {**params['outtmpl'], 'default': value}
+            params[name] = value
+        
+        failed = False
+        try:
+            yield instance.ydl
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            for name, value in saved.items():
+                if value is _MISSING:
+                    params.pop(name, None)
+                else:
+                    params[name] = value
+            self._release(key, instance, failed)
+    
+    def _release(self, key: Hashable, instance: _PooledYoutubeDL, failed: bool):
+        """Return an instance to the pool, or close it if it is worn out"""
+        instance.uses += 1
+        with self._lock:
+            idle = self.idle.setdefault(key, deque())
+            keep = not failed and instance.uses < self.max_uses and len(idle) < self.max_idle
+            if keep:
+                idle.append(instance)
+            else:
+                self.recycled += 1
+        if not keep:
+            self._close(instance)
+    
+    @staticmethod
+    def _close(instance: _PooledYoutubeDL):
+        """Close an instance, saving its cookies and HTTP handlers"""
+        try:
+            instance.ydl.close()
+        except Exception as e:
+            logger.warning(f"Error closing YoutubeDL instance: {e}")
+    
+    def close(self):
+        """Close every idle instance"""
+        with self._lock:
+            instances = [instance for idle in self.idle.values() for instance in idle]
+            self.idle.clear()
+        for instance in instances:
+            self._close(instance)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get pool statistics"""
+        with self._lock:
+            return {
+                'keys': len(self.idle),
+                'idle': sum(len(idle) for idle in self.idle.values()),
+                'created': self.created,
+                'reused': self.reused,
+                'recycled': self.recycled
+            }
+
+# Shared YoutubeDL pool instance
+ydl_pool = YoutubeDLPool()
+
+if __name__ == "__main__":
+    import time
+    
+    # Per-call setup cost: a fresh instance per job versus a pooled one.
+    # Each job looks up the YouTube extractor, as a search or extraction would.
+    iterations = 200
+    opts = Config.YTDL_OPTS.copy()
+    opts['extract_flat'] = 'in_playlist'
+    
+    def fresh_job():
+        with yt_dlp.YoutubeDL(dict(opts)) as ydl:
+            ydl.get_info_extractor('Youtube')
+    
+    def pooled_job():
+        with ydl_pool.get(opts, outtmpl='downloads/benchmark.%(ext)s') as ydl:
+            ydl.get_info_extractor('Youtube')
+    
+    ydl_pool.warm(opts)
+    for label, job in [("fresh", fresh_job), ("pooled", pooled_job)]:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            job()
+        elapsed = time.perf_counter() - started
+        print(f"{label:7} {elapsed / iterations * 1000:7.2f} ms/job")
+    print(ydl_pool.get_stats())
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import re
+from typing import Any, Dict, Iterator, Optional
+import aiohttp
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+INITIAL_DATA_RE = re.compile(r'(?:var\s+|window\[["\'])ytInitialData(?:["\']\])?\s*=\s*')
+
+# Search filter for videos only, as ytsearch uses
+VIDEO_FILTER = 'EgIQAQ=='
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/124.0 Safari/537.36')
+
+class SearchParseError(Exception):
+    """The search page could not be parsed, so the caller should fall back to yt-dlp"""
+    pass
+
+def parse_duration(text: Optional[str]) -> int:
+    """Convert a length like '3:54' or '1:02:03' to seconds"""
+    seconds = 0
+    for part in (text or '').split(':'):
+        if not part.strip().isdigit():
+            return 0
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+def _text(value: Optional[Dict[str, Any]]) -> str:
+    """Get the plain text of a simpleText or runs object"""
+    if not value:
+        return ''
+    if 'simpleText' in value:
+        return value['simpleText']
+    return ''.join(run.get('text', '') for run in value.get('runs') or [])
+
+def _video_renderers(node: Any) -> Iterator[Dict[str, Any]]:
+    """Walk ytInitialData in page order, yielding each videoRenderer"""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == 'videoRenderer' and isinstance(value, dict):
+                yield value
+            else:
+                yield from _video_renderers(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _video_renderers(item)
+
+def extract_initial_data(html: str) -> Dict[str, Any]:
+    """Pull the ytInitialData object out of a results page"""
+    match = INITIAL_DATA_RE.search(html)
+    if not match:
+        raise SearchParseError("ytInitialData not found")
+    try:
+        data, _ = json.JSONDecoder().raw_decode(html, match.end())
+    except ValueError as e:
+        raise SearchParseError(f"ytInitialData is not valid JSON: {e}")
+    if not isinstance(data, dict):
+        raise SearchParseError("ytInitialData is not an object")
+    return data
+
+def parse_search_results(html: str, video: bool = False) -> Optional[Dict[str, Any]]:
+    """Build track info, in the shape search_youtube returns, from the first result on a page"""
+    data = extract_initial_data(html)
+    
+    found = False
+    for renderer in _video_renderers(data):
+        found = True
+        video_id = renderer.get('videoId')
+        if not video_id:
+            continue
+        
+        thumbnails = (renderer.get('thumbnail') or {}).get('thumbnails') or []
+        views = re.sub(r'\D', '', _text(renderer.get('viewCountText')))
+        return {
+            'title': _text(renderer.get('title')) or 'Unknown',
+            'url': None,  # resolved once the track nears the head of the queue
+            'webpage_url': f"https://www.youtube.com/watch?v={video_id}",
+            'duration': parse_duration(_text(renderer.get('lengthText'))),
+            'thumbnail': thumbnails[-1].get('url') if thumbnails else None,
+            'uploader': _text(renderer.get('ownerText') or renderer.get('longBylineText')) or 'Unknown',
+            'view_count': int(views) if views else 0,
+            'is_video': video
+        }
+    
+    # A page with no results at all looks the same as a changed layout
+    raise SearchParseError("no video results" if not found else "no result with a video ID")
+
+class YouTubeSearchClient:
+    """Searches YouTube with one HTTP request, leaving yt-dlp to format resolution"""
+    
+    def __init__(self, base_url: str = Config.YOUTUBE_BASE_URL,
+                 connections: int = Config.YOUTUBE_SEARCH_CONNECTIONS,
+                 timeout: float = Config.YOUTUBE_SEARCH_TIMEOUT):
+        self.base_url = base_url.rstrip('/')
+        self.connections = connections
+        self.timeout = timeout
+        self.session: Optional[aiohttp.ClientSession] = None
+        
+        # Request statistics
+        self.requests = 0
+        self.parse_failures = 0
+        self.http_failures = 0
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Get the shared HTTP session, creating it on first use"""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connections, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={
+                    'User-Agent': USER_AGENT,
+                    'Accept-Language': 'en-US,en;q=0.9'
+                },
+                # Skip the EU consent interstitial
+                cookies={'CONSENT': 'YES+cb', 'SOCS': 'CAI'}
+            )
+        return self.session
+    
+    async def search(self, query: str, video: bool = False) -> Optional[Dict[str, Any]]:
+        """Get the first video result for a query
+        
+        Raises SearchParseError when the page cannot be read and
+        aiohttp.ClientError on request failures; callers fall back to
+        yt-dlp for both.
+        """
+        self.requests += 1
+        try:
+            async with self._get_session().get(
+                f"{self.base_url}/results", params={'search_query': query, 'sp': VIDEO_FILTER}
+            ) as response:
+                response.raise_for_status()
+                html = await response.text()
+        except aiohttp.ClientError:
+            self.http_failures += 1
+            raise
+        
+        try:
+            return parse_search_results(html, video)
+        except SearchParseError:
+            self.parse_failures += 1
+            raise
+    
+    async def close(self):
+        """Release the HTTP session"""
+        if self.session and not self.session.closed:
+            await self.session.close()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get request statistics"""
+        return {
+            'requests': self.requests,
+            'parse_failures': self.parse_failures,
+            'http_failures': self.http_failures
+        }
+
+if __name__ == "__main__":
+    import asyncio
+    from aiohttp import web
+    
+    # Trimmed from a recorded results page: a shelf and an ad ahead of the
+    # first video, and ytInitialData assigned inside an inline script
+    def video_renderer(video_id, title, length, owner, views):
+        return {'videoRenderer': {
+            'videoId': video_id,
+            'title': {'runs': [{'text': title}], 'accessibility': {'accessibilityData': {'label': title}}},
+            'lengthText': {'accessibility': {'accessibilityData': {'label': length}}, 'simpleText': length},
+            'ownerText': {'runs': [{'text': owner, 'navigationEndpoint': {}}]},
+            'viewCountText': {'simpleText': views},
+            'thumbnail': {'thumbnails': [
+                {'url': f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg?sqp=a", 'width': 360, 'height': 202},
+                {'url': f"https://i.ytimg.com/vi/{video_id}/hq720.jpg?sqp=b", 'width': 720, 'height': 404}
+            ]}
+        }}
+    
+    RECORDED = {'contents': {'twoColumnSearchResultsRenderer': {'primaryContents': {'sectionListRenderer': {
+        'contents': [{'itemSectionRenderer': {'contents': [
+            {'adSlotRenderer': {'fulfillmentContent': {}}},
+            {'shelfRenderer': {'title': {'simpleText': 'People also watched'}}},
+            video_renderer('JGwWNGJdvx8', 'Ed Sheeran - Shape of You (Official Music Video)', '4:24',
+                           'Ed Sheeran', '6,345,012,345 views'),
+            video_renderer('_dK2tDK9grQ', 'Ed Sheeran - Shape Of You (Lyrics)', '1:03:53', 'Lyrics Hub', 'No views')
+        ]}}]
+    }}}}}
+    
+    FIXTURES = {
+        'shape of you': (
+            '<html><head><script nonce="x">var ytInitialData = '
+            f'{json.dumps(RECORDED)};</script><script>var ytcfg = {{}};</script></head></html>'
+        ),
+        'window key': f'<script>window["ytInitialData"] = {json.dumps(RECORDED)};</script>',
+        'consent': '<html><form action="https://consent.youtube.com/save"></form></html>',
+        'truncated': '<script>var ytInitialData = {"contents": {"twoColumn',
+        'no results': f'<script>var ytInitialData = {json.dumps({"contents": {}})};</script>'
+    }
+    
+    async def test_search():
+        async def results(request):
+            assert request.query['sp'] == VIDEO_FILTER
+            query = request.query['search_query']
+            if query == 'server error':
+                return web.Response(status=503)
+            return web.Response(text=FIXTURES[query], content_type='text/html')
+        
+        app = web.Application()
+        app.router.add_get('/results', results)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        
+        client = YouTubeSearchClient(base_url=f"http://127.0.0.1:{port}")
+        print(await client.search('shape of you'))
+        print(await client.search('window key', video=True))
+        for query in ['consent', 'truncated', 'no results', 'server error']:
+            try:
+                await client.search(query)
+                print(f"{query!r:15} -> parsed?")
+            except (SearchParseError, aiohttp.ClientError) as e:
+                print(f"{query!r:15} -> fallback ({type(e).__name__}: {e})")
+        print(client.get_stats())
+        
+        await client.close()
+        await runner.cleanup()
+    
+    asyncio.run(test_search())